@@ -6,6 +6,8 @@ from app.services.llm import LLMService, get_current_user, save_chat, load_chat_
 from app.services.memory import ChatMemory
 from app.services.llm import rate_limit
 from app.services.llm import validate_query
+from app.services.executors import ExecutorSaturated
+from app.services.response_cache import response_cache
 import uuid
 
 router = APIRouter()
@@ -54,11 +56,11 @@ async def chat(
         
         # User-scoped retrieval
         retriever = Retriever(user_id=user_id, top_k=5)
-        results = retriever.retrieve(payload.question, document_ids=payload.document_ids)
+        results = await retriever.aretrieve(payload.question, document_ids=payload.document_ids)
 
         if not results:
             llm = LLMService()
-            answer = llm.generate_general_answer(
+            answer = await llm.generate_general_answer(
                 question=payload.question,
                 user_id=user_id,
                 session_id=session_id
@@ -101,14 +103,19 @@ async def chat(
 
         context = "\n\n".join(context_blocks)
         
-        # Generate answer with chat history from DATABASE (cross-session memory)
-        llm = LLMService()
-        answer = llm.generate_answer(
-            question=payload.question,
-            context=context,
-            user_id=user_id,
-            session_id=session_id
-        )
+        # Same question over the same chunks: reuse the earlier answer
+        answer = await response_cache.lookup(user_id, results, payload.question)
+        cached = answer is not None
+        if not cached:
+            # Generate answer with chat history from DATABASE (cross-session memory)
+            llm = LLMService()
+            answer = await llm.generate_answer(
+                question=payload.question,
+                context=context,
+                user_id=user_id,
+                session_id=session_id
+            )
+            await response_cache.store(user_id, results, payload.question, answer)
         
         # Save to BOTH:
         # 1. Memory (RAM) - fast access for current session
@@ -127,6 +134,7 @@ async def chat(
             "answer": answer,
             "sources": list(set(sources)),
             "mode": "documents",
+            "cached": cached,
             "session_id": session_id,
             "conversation_turns": len(memory.get_history(session_id)),
             "user_id": user_id
@@ -134,6 +142,8 @@ async def chat(
     
     except HTTPException:
         raise
+    except ExecutorSaturated:
+        raise  # 503 with Retry-After from the app-level handler
     except Exception as e:
         print(f"Error in chat endpoint: {str(e)}")
         raise HTTPException(
@@ -269,7 +279,7 @@ async def retrieve_context(
     """Retrieve relevant context without chat"""
     user_id = user.id
     retriever = Retriever(user_id=user_id, top_k=5)
-    results = retriever.retrieve(payload.question)
+    results = await retriever.aretrieve(payload.question)
 
     return {
         "question": payload.question,
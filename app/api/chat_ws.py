@@ -1,9 +1,11 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Query
 from app.services.retriever import Retriever
-from app.services.llm import LLMService, save_chat
+from app.services.llm import LLMService, save_chat, STREAM_ERROR_PREFIX
 from app.services.memory import ChatMemory
 from app.services.llm import rate_limit
 from app.services.supabase_client import supabase
+from app.services.executors import ExecutorSaturated
+from app.services.response_cache import response_cache, replay_tokens
 import logging
 import uuid
 
@@ -70,13 +72,17 @@ async def chat_ws(
             
             # Retrieve context with user scoping
             retriever = Retriever(user_id=user_id, top_k=5)
-            results = retriever.retrieve(question)
+            try:
+                results = await retriever.aretrieve(question)
+            except ExecutorSaturated as e:
+                await websocket.send_json({"type": "error", "message": str(e)})
+                continue
             
             if not results:
                 await websocket.send_json({"type": "mode", "mode": "general"})
                 llm = LLMService()
                 full_answer = ""
-                for chunk in llm.stream_general_answer(
+                async for chunk in llm.stream_general_answer(
                     question=question,
                     user_id=user_id,
                     session_id=session_id
@@ -126,21 +132,32 @@ async def chat_ws(
                 "sources": list(set(sources))
             })
             
-            # Stream the answer
-            llm = LLMService()
-            full_answer = ""
-            
-            for chunk in llm.stream_answer(
-                question=question,
-                context=context,
-                user_id=user_id,
-                session_id=session_id
-            ):
-                full_answer += chunk
-                await websocket.send_json({
-                    "type": "token",
-                    "content": chunk
-                })
+            # Replay a cached answer to the same question over the same chunks
+            # as a token stream, so clients handle both paths alike
+            cached_answer = await response_cache.lookup(user_id, results, question)
+            if cached_answer is not None:
+                for chunk in replay_tokens(cached_answer):
+                    await websocket.send_json({"type": "token", "content": chunk})
+                full_answer = cached_answer
+            else:
+                # Stream the answer
+                llm = LLMService()
+                full_answer = ""
+                chunk = ""
+
+                async for chunk in llm.stream_answer(
+                    question=question,
+                    context=context,
+                    user_id=user_id,
+                    session_id=session_id
+                ):
+                    full_answer += chunk
+                    await websocket.send_json({
+                        "type": "token",
+                        "content": chunk
+                    })
+                if not chunk.startswith(STREAM_ERROR_PREFIX):
+                    await response_cache.store(user_id, results, question, full_answer)
             
             # Save to BOTH after streaming completes:
             # 1. Memory (RAM) - fast
@@ -158,6 +175,7 @@ async def chat_ws(
             # Send completion message
             await websocket.send_json({
                 "type": "done",
+                "cached": cached_answer is not None,
                 "session_id": session_id,
                 "conversation_turns": len(memory.get_history(session_id))
             })
@@ -1,4 +1,12 @@
 from fastapi import APIRouter
+import asyncio
+
+from app.services.embeddings import EmbeddingService
+from app.services.executors import embed_executor, search_executor
+from app.services.ingest_queue import ingest_queue
+from app.services.ingest_worker import ingest_pool
+from app.services.response_cache import response_cache
+from app.services.study_cache import study_cache
 
 router = APIRouter()
 
@@ -9,3 +17,33 @@ async def health_check():
         "status": "ok",
         "service": "KnowledgeForge"
     }
+
+
+@router.get("/health/executors")
+async def executor_stats():
+    """Queue depth and wait times of the embedding / search pools, for sizing them."""
+    return {
+        "embed": embed_executor.stats(),
+        "search": search_executor.stats(),
+        "embed_batcher": EmbeddingService().batcher.stats(),
+    }
+
+
+@router.get("/health/caches")
+async def cache_stats():
+    """Hit rates of the RAG response and study artifact caches and, once loaded, the embedding cache."""
+    embedding_cache = EmbeddingService._cache
+    return {
+        "responses": response_cache.stats(),
+        "study_artifacts": study_cache.stats(),
+        "embeddings": embedding_cache.stats() if embedding_cache is not None else None,
+    }
+
+
+@router.get("/health/ingest")
+async def ingest_stats():
+    """Ingestion backlog and the worker pool running it (owner: whether this process started it)."""
+    return {
+        "queue": await asyncio.to_thread(ingest_queue.stats),
+        "pool": ingest_pool.stats(),
+    }
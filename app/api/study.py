@@ -1,8 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 from app.services.llm import get_current_user, rate_limit
 from app.services import study_service
+from app.services.executors import ExecutorSaturated
+import json
 import logging
 
 router = APIRouter()
@@ -13,15 +16,27 @@ class QuizRequest(BaseModel):
     document_ids: List[str]
     num_questions: int = 10
     question_type: str = "mixed"
+    refresh: bool = False  # skip the artifact cache and generate anew
 
 
 class FlashcardRequest(BaseModel):
     document_ids: List[str]
     num_cards: int = 15
+    refresh: bool = False
 
 
 class ConceptsRequest(BaseModel):
     document_ids: List[str]
+    refresh: bool = False
+
+
+class StudyPackRequest(BaseModel):
+    document_ids: List[str]
+    tools: List[str] = list(study_service.PACK_TOOLS)
+    num_cards: int = 15
+    num_questions: int = 10
+    question_type: str = "mixed"
+    refresh: bool = False
 
 
 class StudyPlanRequest(BaseModel):
@@ -41,9 +56,11 @@ class RecallEvalRequest(BaseModel):
     model_answer: str
 
 
-def _handle(fn, *args, **kwargs):
+async def _handle(fn, *args, **kwargs):
     try:
-        return fn(*args, **kwargs)
+        return await fn(*args, **kwargs)
+    except ExecutorSaturated:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -51,43 +68,95 @@ def _handle(fn, *args, **kwargs):
         raise HTTPException(status_code=500, detail="Study feature failed. Please try again.")
 
 
+def _sse(events: AsyncIterator[dict]) -> StreamingResponse:
+    """Server-sent events named by each event's "type"; a failure ends the stream with "error"."""
+    async def body():
+        try:
+            async for event in events:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except ValueError as e:
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+        except ExecutorSaturated as e:
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': str(e), 'retry': True})}\n\n"
+        except Exception as e:
+            logger.error(f"Study stream error: {e}", exc_info=True)
+            detail = "Study feature failed. Please try again."
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': detail})}\n\n"
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # keep proxies from holding events back
+    })
+
+
 @router.post("/study/quiz")
 async def generate_quiz(payload: QuizRequest, user=Depends(get_current_user)):
     rate_limit(user.id)
-    return _handle(study_service.generate_quiz,
-                   user.id, payload.document_ids, payload.num_questions, payload.question_type)
+    return await _handle(study_service.generate_quiz,
+                         user.id, payload.document_ids, payload.num_questions, payload.question_type,
+                         payload.refresh)
 
 
 @router.post("/study/flashcards")
 async def generate_flashcards(payload: FlashcardRequest, user=Depends(get_current_user)):
     rate_limit(user.id)
-    return _handle(study_service.generate_flashcards,
-                   user.id, payload.document_ids, payload.num_cards)
+    return await _handle(study_service.generate_flashcards,
+                         user.id, payload.document_ids, payload.num_cards, payload.refresh)
+
+
+@router.post("/study/quiz/stream")
+async def stream_quiz(payload: QuizRequest, user=Depends(get_current_user)):
+    rate_limit(user.id)
+    return _sse(study_service.stream_quiz(
+        user.id, payload.document_ids, payload.num_questions, payload.question_type, payload.refresh))
+
+
+@router.post("/study/flashcards/stream")
+async def stream_flashcards(payload: FlashcardRequest, user=Depends(get_current_user)):
+    rate_limit(user.id)
+    return _sse(study_service.stream_flashcards(
+        user.id, payload.document_ids, payload.num_cards, payload.refresh))
 
 
 @router.post("/study/concepts")
 async def extract_concepts(payload: ConceptsRequest, user=Depends(get_current_user)):
     rate_limit(user.id)
-    return _handle(study_service.extract_key_concepts,
-                   user.id, payload.document_ids)
+    return await _handle(study_service.extract_key_concepts,
+                         user.id, payload.document_ids, payload.refresh)
+
+
+@router.post("/study/pack")
+async def generate_pack(payload: StudyPackRequest, user=Depends(get_current_user)):
+    """Concepts, flashcards and a quiz in one call, each sent as an event when ready."""
+    rate_limit(user.id)
+    return _sse(study_service.generate_pack(
+        user.id, payload.document_ids, payload.tools, payload.num_cards,
+        payload.num_questions, payload.question_type, payload.refresh))
 
 
 @router.post("/study/plan")
 async def create_study_plan(payload: StudyPlanRequest, user=Depends(get_current_user)):
     rate_limit(user.id)
-    return _handle(study_service.generate_study_plan,
-                   user.id, payload.document_ids, payload.exam_date, payload.hours_per_day)
+    return await _handle(study_service.generate_study_plan,
+                         user.id, payload.document_ids, payload.exam_date, payload.hours_per_day)
+
+
+@router.post("/study/plan/stream")
+async def stream_study_plan(payload: StudyPlanRequest, user=Depends(get_current_user)):
+    rate_limit(user.id)
+    return _sse(study_service.stream_study_plan(
+        user.id, payload.document_ids, payload.exam_date, payload.hours_per_day))
 
 
 @router.post("/study/recall/question")
 async def get_recall_question(payload: RecallQuestionRequest, user=Depends(get_current_user)):
     rate_limit(user.id)
-    return _handle(study_service.generate_active_recall_question,
-                   user.id, payload.document_ids, payload.previous_questions)
+    return await _handle(study_service.generate_active_recall_question,
+                         user.id, payload.document_ids, payload.previous_questions)
 
 
 @router.post("/study/recall/evaluate")
 async def evaluate_recall(payload: RecallEvalRequest, user=Depends(get_current_user)):
     rate_limit(user.id)
-    return _handle(study_service.evaluate_recall_answer,
-                   payload.question, payload.student_answer, payload.model_answer)
+    return await _handle(study_service.evaluate_recall_answer,
+                         payload.question, payload.student_answer, payload.model_answer)
@@ -1,51 +1,29 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from pathlib import Path
+import asyncio
+import uuid
 import aiofiles
 
 from app.services.document_loader import DocumentLoader
-from app.services.indexer import Indexer
-from app.services.database import save_document, update_document_status, get_document
+from app.services.database import save_document, get_document
 from app.services.llm import get_current_user
+from app.services.executors import search_executor
+from app.services.response_cache import response_cache
+from app.services.study_cache import study_cache
+from app.services.ingest_queue import ingest_queue
+from app.services.ingest_worker import UPLOAD_DIR, remove_upload
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-UPLOAD_DIR = Path("data/uploads")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 MAX_FILE_MB = 100
 
 
-def _process_in_background(file_path: Path, user_id: str, document_id: str):
-    try:
-        document = DocumentLoader.load(file_path)
-
-        if len(document["pages"]) == 0:
-            update_document_status(document_id, "failed", "No text could be extracted from this file.")
-            return
-
-        indexer = Indexer(user_id=user_id)
-        num_chunks = indexer.index_document(document, document_id)
-
-        if num_chunks == 0:
-            update_document_status(document_id, "failed", "No text chunks could be created.")
-            return
-
-        update_document_status(document_id, "ready")
-        logger.info(f"Background processing done: {document_id} ({num_chunks} chunks)")
-
-    except Exception as e:
-        logger.error(f"Background processing failed for doc {document_id}: {e}", exc_info=True)
-        update_document_status(document_id, "failed", str(e))
-    finally:
-        if file_path.exists():
-            file_path.unlink()
-
-
 @router.post("/upload")
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     user=Depends(get_current_user),
 ):
@@ -55,9 +33,11 @@ async def upload_document(
     if ext not in DocumentLoader.SUPPORTED_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Unsupported file type.")
 
-    user_upload_dir = UPLOAD_DIR / user_id
-    user_upload_dir.mkdir(parents=True, exist_ok=True)
-    file_path = user_upload_dir / file.filename
+    # One directory per upload: parallel uploads of same-named files must not
+    # overwrite each other, and the loader takes the filename from the path
+    upload_dir = UPLOAD_DIR / user_id / uuid.uuid4().hex
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    file_path = upload_dir / file.filename
 
     # Stream bytes to disk as they arrive — avoids buffering the whole file in memory
     size_bytes = 0
@@ -68,6 +48,7 @@ async def upload_document(
             if size_bytes > max_bytes:
                 await out.close()
                 file_path.unlink(missing_ok=True)
+                upload_dir.rmdir()
                 raise HTTPException(
                     status_code=413,
                     detail=f"File exceeds the {MAX_FILE_MB} MB limit."
@@ -80,7 +61,8 @@ async def upload_document(
     doc_record = save_document(user_id=user_id, filename=file.filename)
     document_id = doc_record["id"]
 
-    background_tasks.add_task(_process_in_background, file_path, user_id, document_id)
+    # Durable: an ingestion worker picks it up, even after a restart
+    await asyncio.to_thread(ingest_queue.enqueue, document_id, user_id, file_path)
 
     logger.info(f"Upload accepted for user {user_id}, doc {document_id} ({size_mb:.1f} MB) — processing in background")
 
@@ -117,7 +99,8 @@ async def list_documents(user=Depends(get_current_user)):
 @router.delete("/documents/{filename}")
 async def delete_document(filename: str, user=Depends(get_current_user)):
     from app.services.database import delete_document, get_user_documents
-    from app.services.vector_store import FAISSVectorStore
+    from app.services.vector_store import store_path_for
+    from app.services.store_registry import store_registry
 
     user_id = user.id
     docs = get_user_documents(user_id)
@@ -127,12 +110,22 @@ async def delete_document(filename: str, user=Depends(get_current_user)):
 
     document_id = doc["id"]
 
-    store_path = Path(f"data/vector_store/{user_id}")
-    if store_path.exists():
-        vector_store = FAISSVectorStore(dim=384, store_path=store_path)
-        vector_store.load()
-        vector_store.delete_by_document_id(document_id)
-        vector_store.save()
+    # Not indexed yet: forget the job and its upload. A worker still reading it
+    # finds the job gone when it finishes and removes whatever is left
+    job = await asyncio.to_thread(ingest_queue.cancel, document_id)
+    if job is not None:
+        remove_upload(Path(job["file_path"]))
+
+    if store_path_for(user_id).exists():
+        def delete_vectors():
+            vector_store = store_registry.get(user_id)
+            with vector_store.transaction():
+                vector_store.delete_by_document_id(document_id)
+
+        # Loading the store and rewriting its files stays off the event loop
+        await search_executor.run(delete_vectors)
+        response_cache.invalidate_documents(user_id, [document_id])
+        await asyncio.to_thread(study_cache.invalidate_documents, user_id, [document_id])
 
     delete_document(user_id=user_id, filename=filename)
 
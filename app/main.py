@@ -2,6 +2,7 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+import asyncio
 import logging
 import os
 
@@ -12,6 +13,9 @@ from app.api.upload import router as upload_router
 from app.api.chat import router as chat_router
 from app.api.chat_ws import router as chat_ws_router
 from app.api.study import router as study_router
+from app.services.executors import ExecutorSaturated
+from app.services.ingest_worker import ingest_pool
+from app.services.llm import close_groq_client
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +44,23 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": "Internal server error"},
     )
 
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
+@app.on_event("startup")
+async def startup():
+    await asyncio.to_thread(ingest_pool.start)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await asyncio.to_thread(ingest_pool.stop)
+    await close_groq_client()
+
 # ============= ROUTERS =============
 
 app.include_router(health_router, prefix="/api")
@@ -0,0 +1,113 @@
+"""
+Convert existing per-user vector stores to compressed storage in place.
+
+    python -m app.scripts.compress_vector_stores --storage sq8 --rerank-factor 4
+
+Every data/vector_store/<user_id> directory is re-encoded with the requested
+storage while keeping its search structure (flat / HNSW / IVF). Before a store
+is rewritten, recall@k of the new index is measured against exact float32
+search over the store's current vectors, and stores that fall below
+--min-recall are left untouched. Defaults come from VECTOR_STORAGE and
+VECTOR_RERANK_FACTOR; run the API servers with the same values, or their
+background rebuilds will re-encode stores back to what they are configured for.
+Uploads to a store wait while it is being converted.
+"""
+import argparse
+import faiss
+import numpy as np
+from pathlib import Path
+
+from app.services.faiss_index import (
+    VECTOR_RERANK_FACTOR, VECTOR_STORAGE,
+    build_index, index_spec, normalize_spec, search_params,
+)
+from app.services.vector_store import FAISSVectorStore, EMBEDDING_DIM, VECTOR_STORE_DIR
+
+
+def recall_at_k(index, ids: np.ndarray, vectors: np.ndarray, k: int, n_queries: int,
+                rerank_factor: int = 0, seed: int = 0) -> float:
+    """Mean overlap between index's top-k and exact top-k for sampled stored vectors."""
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)]
+    _, exact = faiss.knn(queries, vectors, k)
+    exact = ids[exact]
+    _, approx = index.search(queries, k, params=search_params(index, rerank_factor=rerank_factor))
+    hits = sum(len(set(a) & set(e)) for a, e in zip(approx, exact))
+    return hits / (len(queries) * k)
+
+
+def _index_file_bytes(index) -> int:
+    return len(faiss.serialize_index(index))
+
+
+def convert_store(store_path: Path, storage: str, rerank_factor: int, k: int, n_queries: int,
+                  min_recall: float, dry_run: bool) -> dict:
+    store = FAISSVectorStore(dim=EMBEDDING_DIM, store_path=store_path)
+    store.load()
+    report = {"store": store_path.name, "vectors": store.live_count()}
+
+    with store.transaction():
+        ntotal = store.live_count()
+        if ntotal == 0:
+            return {**report, "status": "empty"}
+
+        current = index_spec(store.index)
+        spec = normalize_spec(current.structure, storage, rerank_factor > 0, ntotal)
+        if spec == current and not len(store.tombstones) and not store.segments:
+            return {**report, "status": "unchanged", "spec": spec}
+
+        ids, vectors = store.export_live()
+        new_index = build_index(spec, EMBEDDING_DIM, vectors, ids)
+        recall = recall_at_k(new_index, ids, vectors, k, n_queries, rerank_factor)
+        report.update({
+            "spec": spec,
+            "recall": recall,
+            "bytes_before": sum((store_path / f).stat().st_size for f in store.index_files()),
+            "bytes_after": _index_file_bytes(new_index),
+        })
+
+        if recall < min_recall:
+            return {**report, "status": "skipped (recall below threshold)"}
+        if dry_run:
+            return {**report, "status": "dry run"}
+
+        store.swap_index(new_index)
+        return {**report, "status": "converted"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--storage", choices=["float32", "sq8", "pq"], default=VECTOR_STORAGE)
+    parser.add_argument("--rerank-factor", type=int, default=VECTOR_RERANK_FACTOR,
+                        help="keep float32 vectors for an exact re-rank (> 0 enables)")
+    parser.add_argument("--k", type=int, default=10, help="k for recall@k")
+    parser.add_argument("--queries", type=int, default=200, help="sampled queries per store")
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("--dry-run", action="store_true", help="measure only, write nothing")
+    parser.add_argument("--root", type=Path, default=VECTOR_STORE_DIR)
+    args = parser.parse_args(argv)
+
+    if not args.root.exists():
+        print(f"No vector stores under {args.root}")
+        return
+
+    for store_path in sorted(p for p in args.root.iterdir() if p.is_dir()):
+        try:
+            r = convert_store(store_path, args.storage, args.rerank_factor, args.k,
+                              args.queries, args.min_recall, args.dry_run)
+        except Exception as e:
+            print(f"{store_path.name}: failed: {e}")
+            continue
+
+        line = f"{r['store']}: {r['status']} ({r['vectors']} vectors"
+        if "recall" in r:
+            line += (f", {r['spec'].structure}/{r['spec'].storage}"
+                     f"{'+rerank' if r['spec'].rerank else ''}"
+                     f", recall@{args.k}={r['recall']:.3f}"
+                     f", {r['bytes_before'] / 1e6:.1f} MB -> {r['bytes_after'] / 1e6:.1f} MB")
+        print(line + ")")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Run the document ingestion workers outside the API process.
+
+    python -m app.scripts.ingest_worker --workers 2
+
+For deployments that start the API with INGEST_WORKERS=0 and run ingestion
+as a separate process. Stops (letting running jobs finish) on SIGTERM/SIGINT.
+"""
+import argparse
+import signal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services.ingest_worker import INGEST_WORKERS, IngestWorkerPool
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=max(INGEST_WORKERS, 1))
+    parser.add_argument("--stop-timeout", type=float, default=60)
+    args = parser.parse_args(argv)
+
+    pool = IngestWorkerPool(args.workers)
+    if not pool.start():
+        raise SystemExit("Another ingestion pool is already running on this machine.")
+
+    def stop(signum, frame):
+        pool.stop(args.stop_timeout)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    pool.join()
+
+
+if __name__ == "__main__":
+    main()
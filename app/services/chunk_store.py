@@ -0,0 +1,315 @@
+"""
+Columnar, memory-mappable chunk metadata addressed by chunk id.
+
+Replaces the pickled list of dicts that used to sit next to index.faiss.
+Integer columns (chunk id, document, page, chunk index, text offset/length)
+are raw append-only .col files memory-mapped with np.memmap, chunk text lives
+once in a single append-only text blob, and the small document table
+(document_id and filename, which every dict used to repeat) is kept in the
+store's manifest. Loading is therefore constant-time, saving new chunks only
+appends their bytes, and a search result is only materialised into a dict when
+it is actually returned.
+
+Chunk ids are the stable 64-bit ids the FAISS index is keyed by. They are
+handed out in increasing order, so the id column stays sorted and an id is
+resolved to its row with a binary search. Deleting a document only flags it in
+the document table; its rows are dropped on the next compaction.
+"""
+import mmap
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Iterable, Optional
+
+_COLUMNS = {
+    "id": np.int64,
+    "doc": np.int32,
+    "page": np.int32,
+    "chunk": np.int32,
+    "text_offset": np.int64,
+    "text_length": np.int32,
+}
+
+
+class ChunkStore:
+    DIR = "chunks"
+
+    # Compact once more than this fraction of rows belongs to deleted documents
+    COMPACT_RATIO = 0.5
+
+    def __init__(self, store_path: Path):
+        self.path = store_path / self.DIR
+        self._version = 0        # file version; bumped by every full rewrite
+        self.clear()
+
+    def clear(self, keep_next_id: bool = False):
+        """Drop every chunk. keep_next_id carries on numbering where the store left
+        off, so an emptied store never hands out an id it has used before."""
+        self.documents: List[Dict] = []
+        self._doc_lookup: Dict[tuple, int] = {}
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.empty(0, dtype=dtype) for name, dtype in _COLUMNS.items()
+        }
+        if not keep_next_id:
+            self.next_id = 0
+        self._postings = None    # doc index -> rows, built on first use
+        self._blob = b""         # persisted text.bin (memory-mapped once loaded)
+        self._blob_size = 0      # bytes of text.bin covered by meta.json
+        self._tail = bytearray() # text appended since the last save()
+        self._dead_rows = 0      # rows owned by deleted documents
+        self._dead_bytes = 0     # text.bin bytes owned by deleted documents
+        self._mapped = False     # columns are still read-only views of disk
+        self._saved_rows = 0     # leading rows already in the .col files
+
+    def __len__(self) -> int:
+        return len(self.columns["id"])
+
+    def live_count(self) -> int:
+        return len(self) - self._dead_rows
+
+    # ---------- reads ----------
+
+    def text(self, row: int) -> str:
+        start = int(self.columns["text_offset"][row])
+        end = start + int(self.columns["text_length"][row])
+        if start >= self._blob_size:
+            data = self._tail[start - self._blob_size:end - self._blob_size]
+        else:
+            data = self._blob[start:end]
+        return bytes(data).decode("utf-8")
+
+    def get(self, row: int) -> Dict:
+        """Materialise one chunk as the dict shape the API has always returned."""
+        doc = self.documents[int(self.columns["doc"][row])]
+        return {
+            "filename": doc["filename"],
+            "page": int(self.columns["page"][row]),
+            "chunk_index": int(self.columns["chunk"][row]),
+            "text": self.text(row),
+            "document_id": doc["document_id"],
+            "chunk_id": int(self.columns["id"][row]),
+        }
+
+    def rows_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        """Rows holding the given chunk ids, in the same order; unknown ids are dropped."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.columns["id"], ids), len(self) - 1)
+        return rows[self.columns["id"][rows] == ids]
+
+    def _doc_indices(self, document_ids: Iterable) -> List[int]:
+        id_set = set(document_ids)
+        return [
+            i for i, d in enumerate(self.documents)
+            if d["document_id"] in id_set and not d.get("deleted")
+        ]
+
+    def _posting(self, doc_idx: int) -> np.ndarray:
+        if self._postings is None:
+            doc = np.asarray(self.columns["doc"])
+            order = np.argsort(doc, kind="stable")
+            bounds = np.searchsorted(doc[order], np.arange(len(self.documents) + 1))
+            self._postings = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.documents))]
+        return self._postings[doc_idx]
+
+    def live_documents(self) -> set:
+        """(document_id, first chunk id) of every document not deleted; a re-indexed
+        document gets new chunk ids, and compaction keeps them."""
+        return {
+            (d["document_id"], int(self.columns["id"][self._posting(i)[0]]))
+            for i, d in enumerate(self.documents) if not d.get("deleted") and len(self._posting(i))
+        }
+
+    def rows_for_documents(self, document_ids: Iterable) -> np.ndarray:
+        doc_idx = self._doc_indices(document_ids)
+        if not doc_idx:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self._posting(i) for i in doc_idx])
+
+    def ids_for_documents(self, document_ids: Iterable) -> np.ndarray:
+        return np.asarray(self.columns["id"][self.rows_for_documents(document_ids)], dtype=np.int64)
+
+    def sorted_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Order rows by (document_id, page), keeping chunk order within a page."""
+        ranks = {
+            i: r for r, i in enumerate(
+                sorted(range(len(self.documents)), key=lambda i: str(self.documents[i]["document_id"]))
+            )
+        }
+        doc_rank = np.array([ranks[int(d)] for d in self.columns["doc"][rows]], dtype=np.int64)
+        order = np.lexsort((rows, self.columns["page"][rows], doc_rank))
+        return rows[order]
+
+    def nbytes(self) -> int:
+        """Heap bytes held by this store (mapped columns and text are not counted)."""
+        columns = 0 if self._mapped else sum(c.nbytes for c in self.columns.values())
+        return columns + len(self._tail)
+
+    # ---------- writes ----------
+
+    def append(self, metadatas: List[Dict]) -> np.ndarray:
+        """Append chunks and return the ids assigned to them."""
+        new = {name: np.empty(len(metadatas), dtype=dtype) for name, dtype in _COLUMNS.items()}
+        offset = self._blob_size + len(self._tail)
+
+        for i, m in enumerate(metadatas):
+            key = (m.get("document_id"), m.get("filename", "Unknown"))
+            if key not in self._doc_lookup:
+                self._doc_lookup[key] = len(self.documents)
+                self.documents.append({"document_id": key[0], "filename": key[1]})
+            encoded = m.get("text", "").encode("utf-8")
+            new["doc"][i] = self._doc_lookup[key]
+            new["page"][i] = m.get("page", 0)
+            new["chunk"][i] = m.get("chunk_index", 0)
+            new["text_offset"][i] = offset
+            new["text_length"][i] = len(encoded)
+            self._tail += encoded
+            offset += len(encoded)
+
+        new["id"] = np.arange(self.next_id, self.next_id + len(metadatas), dtype=np.int64)
+        self.next_id += len(metadatas)
+
+        self.columns = {
+            name: np.concatenate([self.columns[name], new[name]]) for name in _COLUMNS
+        }
+        self._postings = None
+        self._mapped = False
+        return new["id"]
+
+    def delete_document(self, document_id) -> np.ndarray:
+        """Flag document_id as deleted and return the ids of its chunks."""
+        doc_idx = self._doc_indices([document_id])
+        if not doc_idx:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate([self._posting(i) for i in doc_idx])
+        for i in doc_idx:
+            self.documents[i]["deleted"] = True
+            # Free the (document_id, filename) key in case it is re-uploaded
+            self._doc_lookup.pop((self.documents[i]["document_id"], self.documents[i]["filename"]), None)
+        self._dead_rows += len(rows)
+        self._dead_bytes += int(self.columns["text_length"][rows].sum())
+        return np.asarray(self.columns["id"][rows], dtype=np.int64)
+
+    def _compact(self):
+        """Drop deleted documents' rows and text and renumber the document table."""
+        live_docs = [i for i, d in enumerate(self.documents) if not d.get("deleted")]
+        remap = np.full(len(self.documents), -1, dtype=np.int32)
+        remap[live_docs] = np.arange(len(live_docs), dtype=np.int32)
+
+        mask = remap[self.columns["doc"]] >= 0
+        texts = [self.text(row).encode("utf-8") for row in np.flatnonzero(mask)]
+        columns = {name: np.asarray(col[mask]) for name, col in self.columns.items()}
+        columns["doc"] = remap[columns["doc"]]
+        lengths = np.array([len(t) for t in texts], dtype=np.int64)
+        columns["text_offset"] = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64) if texts else lengths
+        columns["text_length"] = lengths.astype(np.int32)
+
+        self.documents = [self.documents[i] for i in live_docs]
+        self._doc_lookup = {(d["document_id"], d["filename"]): i for i, d in enumerate(self.documents)}
+        self.columns = columns
+        # Everything is rewritten to fresh files by save()
+        self._blob, self._blob_size = b"", 0
+        self._tail = bytearray(b"".join(texts))
+        self._dead_rows = 0
+        self._dead_bytes = 0
+        self._postings = None
+        self._saved_rows = 0
+
+    # ---------- persistence ----------
+
+    def save(self) -> Dict:
+        """Write new rows and text and return the metadata that commits them.
+
+        Appends go to the end of the current files, past the committed length,
+        so readers of the previous metadata are unaffected. Compaction and other
+        full rewrites go to a new file version. The caller makes the returned
+        metadata durable (it is part of the vector store's manifest).
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        if self._dead_rows and self._dead_rows > self.COMPACT_RATIO * len(self):
+            self._compact()
+
+        if self._saved_rows == 0:
+            self._version += 1
+            for name, col in self.columns.items():
+                np.ascontiguousarray(col).tofile(self._column_file(name))
+            with open(self._text_file(), "wb") as f:
+                f.write(self._blob[:self._blob_size])
+                f.write(self._tail)
+        else:
+            for name, col in self.columns.items():
+                self._append(self._column_file(name), self._saved_rows * col.itemsize,
+                             np.ascontiguousarray(col[self._saved_rows:]).tobytes())
+            self._append(self._text_file(), self._blob_size, self._tail)
+        self._saved_rows = len(self)
+        self._blob_size += len(self._tail)
+        self._tail = bytearray()
+        self._map()
+
+        return {
+            "version": self._version,
+            "documents": self.documents,
+            "next_id": self.next_id,
+            "rows": len(self),
+            "text_bytes": self._blob_size,
+            "dead_rows": self._dead_rows,
+            "dead_bytes": self._dead_bytes,
+        }
+
+    @staticmethod
+    def _append(path: Path, committed: int, data: bytes):
+        # Bytes past the committed length are leftovers of an uncommitted save
+        with open(path, "ab") as f:
+            f.truncate(committed)
+            f.write(data)
+
+    def files(self) -> List[str]:
+        """Files (relative to the store directory) backing the loaded state."""
+        if not self._version:
+            return []
+        names = [self._column_file(n).name for n in _COLUMNS] + [self._text_file().name]
+        return [f"{self.DIR}/{name}" for name in names]
+
+    def load(self, meta: Optional[Dict] = None):
+        """Load the state committed by meta; None (nothing committed yet) leaves it empty."""
+        self.clear()
+        self._version = 0
+        if meta is None:
+            return
+
+        self._version = meta["version"]
+        self.documents = meta["documents"]
+        self._doc_lookup = {
+            (d["document_id"], d["filename"]): i
+            for i, d in enumerate(self.documents) if not d.get("deleted")
+        }
+        self._blob_size = meta["text_bytes"]
+        self._dead_rows = meta["dead_rows"]
+        self._dead_bytes = meta["dead_bytes"]
+        self.next_id = meta["next_id"]
+        self._saved_rows = meta["rows"]
+        self._map()
+
+    def _column_file(self, name: str) -> Path:
+        return self.path / f"{name}-{self._version}.col"
+
+    def _text_file(self) -> Path:
+        return self.path / f"text-{self._version}.bin"
+
+    def _map(self):
+        for name, dtype in _COLUMNS.items():
+            if self._saved_rows:
+                self.columns[name] = np.memmap(
+                    self._column_file(name), dtype=dtype, mode="r", shape=(self._saved_rows,)
+                )
+            else:
+                self.columns[name] = np.empty(0, dtype=dtype)
+        self._map_text()
+        self._mapped = True
+
+    def _map_text(self):
+        self._blob = b""
+        if self._blob_size:
+            with open(self._text_file(), "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
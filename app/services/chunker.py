@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List
 
 
 class TextChunker:
@@ -42,22 +42,21 @@ class TextChunker:
         return chunks
 
     def chunk_document(self, document: Dict) -> List[Dict]:
-        chunks = []
+        return list(self.chunk_pages(document["filename"], document["pages"]))
 
-        for page in document["pages"]:
+    def chunk_pages(self, filename: str, pages: Iterable[Dict]) -> Iterator[Dict]:
+        """Chunks of each page, yielded as the pages arrive."""
+        for page in pages:
             page_text = page["text"]
             page_num = page["page"]
 
             for chunk_index, chunk_text in enumerate(self._chunk_text(page_text)):
                 if chunk_text.strip():
-                    chunks.append({
+                    yield {
                         "text": chunk_text,
                         "metadata": {
-                            "filename": document["filename"],
+                            "filename": filename,
                             "page": page_num,
-                            "chunk_index": chunk_index,
-                            "text": chunk_text
+                            "chunk_index": chunk_index
                         }
-                    })
-
-        return chunks
\ No newline at end of file
+                    }
@@ -28,6 +28,11 @@ def get_user_documents(user_id: str):
     response = supabase.table("documents").select("*").eq("user_id", user_id).execute()
     return response.data
 
+def get_documents_by_status(status: str):
+    """Get every user's documents in a given status (e.g. to recover after a restart)"""
+    response = supabase.table("documents").select("id, user_id, filename").eq("status", status).execute()
+    return response.data
+
 def delete_document(user_id: str, filename: str):
     """Delete document metadata"""
     supabase.table("documents").delete().eq("user_id", user_id).eq("filename", filename).execute()
\ No newline at end of file
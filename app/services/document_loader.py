@@ -1,11 +1,89 @@
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Iterator, List, Optional
 import fitz  # PyMuPDF
 from docx import Document
 from PIL import Image
 import pytesseract
-import io
+import multiprocessing
 import os
+import threading
+
+# Embedded text of large PDFs can be extracted by a pool of processes, each
+# opening the file itself and reading PDF_EXTRACT_RANGE_PAGES pages at a time
+# (PyMuPDF holds the GIL, so threads would not help). 0 processes keeps the
+# single-threaded page loop; smaller PDFs always use it, as they finish
+# before a process pool pays off.
+PDF_EXTRACT_PROCESSES = int(os.getenv("PDF_EXTRACT_PROCESSES", "0"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_EXTRACT_RANGE_PAGES = int(os.getenv("PDF_EXTRACT_RANGE_PAGES", "32"))
+
+# Scanned pages are OCRed by OCR_WORKERS threads; each renders its page just
+# before OCR, so no more than OCR_WORKERS page images exist at any time
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str((os.cpu_count() or 1) * 2)))
+
+# PyMuPDF must not run on several threads at once: the page loop and the OCR
+# threads take turns (rendering is quick; tesseract, the slow part, runs unlocked)
+_mupdf_lock = threading.Lock()
+
+_extract_pool: Optional[ProcessPoolExecutor] = None
+_extract_pool_size = 0
+_extract_pool_lock = threading.Lock()
+
+
+def _get_extract_pool(processes: int) -> ProcessPoolExecutor:
+    # Kept for the life of the process: starting one costs more than extracting a small PDF
+    global _extract_pool, _extract_pool_size
+    with _extract_pool_lock:
+        if _extract_pool is None or _extract_pool_size != processes:
+            if _extract_pool is not None:
+                _extract_pool.shutdown(wait=False)
+            _extract_pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn"))
+            _extract_pool_size = processes
+        return _extract_pool
+
+
+def _reset_extract_pool():
+    global _extract_pool
+    with _extract_pool_lock:
+        _extract_pool = None
+
+
+def _extract_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Embedded text of pages [start, stop), run in an extraction process."""
+    with fitz.open(file_path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def serial_page_texts(doc: "fitz.Document") -> Iterator[str]:
+    for i in range(len(doc)):
+        with _mupdf_lock:
+            text = doc[i].get_text()
+        yield text
+
+
+def parallel_page_texts(file_path: Path, page_count: int, processes: int) -> Iterator[str]:
+    """Embedded text of every page, in order, extracted by a process pool."""
+    pool = _get_extract_pool(processes)
+    ranges = (
+        (start, min(start + PDF_EXTRACT_RANGE_PAGES, page_count))
+        for start in range(0, page_count, PDF_EXTRACT_RANGE_PAGES)
+    )
+    try:
+        # Two ranges per process in flight: workers stay busy, memory stays bounded
+        in_flight = deque(pool.submit(_extract_range, str(file_path), *r) for r in islice(ranges, 2 * processes))
+        while in_flight:
+            texts = in_flight.popleft().result()
+            for r in islice(ranges, 1):
+                in_flight.append(pool.submit(_extract_range, str(file_path), *r))
+            yield from texts
+    except BrokenProcessPool:
+        # A worker died (e.g. MuPDF crashed on this file); the next document gets a fresh pool
+        _reset_extract_pool()
+        raise
 
 
 class DocumentLoader:
@@ -25,13 +103,38 @@ class DocumentLoader:
         else:
             raise ValueError("Unsupported file type")
 
+    @staticmethod
+    def iter_pages(file_path: Path) -> Iterator[dict]:
+        """The pages of load(file_path)["pages"], yielded in order as they are extracted."""
+        ext = file_path.suffix.lower()
+
+        if ext == ".pdf":
+            yield from DocumentLoader._iter_pdf(file_path)
+        elif ext == ".docx":
+            yield from DocumentLoader._load_docx(file_path)["pages"]
+        elif ext == ".txt":
+            yield from DocumentLoader._load_txt(file_path)["pages"]
+        else:
+            raise ValueError("Unsupported file type")
+
     MAX_OCR_PAGES = 150  # cap OCR to avoid runaway processing on large scanned PDFs
 
     @staticmethod
-    def _ocr_page(i: int, img: Image.Image) -> tuple:
+    def _ocr_page(doc: "fitz.Document", i: int) -> tuple:
         try:
-            # --oem 1 = LSTM only (faster); --psm 6 = uniform text block
-            text = pytesseract.image_to_string(img, config="--oem 1 --psm 6")
+            with _mupdf_lock:
+                # 1.5x zoom — good enough for tesseract, 44% fewer pixels than 2x.
+                # Grayscale: tesseract binarizes anyway, and it is a third of RGB's size
+                pix = doc[i].get_pixmap(matrix=fitz.Matrix(1.5, 1.5), colorspace=fitz.csGRAY, alpha=False)
+            # Wraps the pixmap's samples in place, no PNG encode/decode round trip
+            img = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", pix.stride, 1)
+            try:
+                # --oem 1 = LSTM only (faster); --psm 6 = uniform text block
+                text = pytesseract.image_to_string(img, config="--oem 1 --psm 6")
+            finally:
+                # The image borrows the pixmap's buffer: drop it before the pixmap goes
+                img.close()
+                del img
         except Exception as e:
             print(f"OCR failed for page {i+1}: {e}")
             text = ""
@@ -39,38 +142,51 @@ class DocumentLoader:
 
     @staticmethod
     def _load_pdf(file_path: Path) -> dict:
-        doc = fitz.open(file_path)
-        pages = [None] * len(doc)
-        to_ocr = []
-
-        # First pass: pull embedded text and render page images for scanned
-        # pages. Rendering is cheap; the actual OCR call is the slow part.
-        for i, page in enumerate(doc):
-            text = page.get_text()
-
-            if not text.strip() and len(to_ocr) < DocumentLoader.MAX_OCR_PAGES:
-                # 1.5x zoom — good enough for tesseract, 44% fewer pixels than 2x
-                pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
-                img = Image.open(io.BytesIO(pix.tobytes("png")))
-                to_ocr.append((i, img))
-            else:
-                pages[i] = {"page": i + 1, "text": text}
-
-        # Second pass: OCR the scanned pages concurrently. pytesseract shells
-        # out to the tesseract binary, which releases the GIL, so this
-        # actually overlaps across CPU cores instead of running one page at a time.
-        if to_ocr:
-            max_workers = min(len(to_ocr), (os.cpu_count() or 1) * 2)
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                for i, text in executor.map(lambda args: DocumentLoader._ocr_page(*args), to_ocr):
-                    pages[i] = {"page": i + 1, "text": text}
-
         return {
             "filename": file_path.name,
             "type": "pdf",
-            "pages": pages
+            "pages": list(DocumentLoader._iter_pdf(file_path))
         }
 
+    @staticmethod
+    def _iter_pdf(file_path: Path) -> Iterator[dict]:
+        # Embedded text is pulled page by page; scanned pages are queued for
+        # OCR on a thread pool, which renders each one only when it gets to
+        # it. pytesseract shells out to the tesseract binary, which releases
+        # the GIL, so OCR overlaps across CPU cores. Pages are handed back in
+        # order as soon as their text is ready; past max_pending pages waiting
+        # on OCR, extraction waits too, so memory stays flat however long the PDF.
+        max_workers = OCR_WORKERS
+        max_pending = 2 * max_workers
+        pending = deque()  # (index, text or OCR future), in page order
+        ocr_pages = 0
+
+        with fitz.open(file_path) as doc, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            if PDF_EXTRACT_PROCESSES > 0 and len(doc) >= PDF_PARALLEL_MIN_PAGES:
+                texts = parallel_page_texts(file_path, len(doc), PDF_EXTRACT_PROCESSES)
+            else:
+                texts = serial_page_texts(doc)
+
+            for i, text in enumerate(texts):
+                if not text.strip() and ocr_pages < DocumentLoader.MAX_OCR_PAGES:
+                    ocr_pages += 1
+                    pending.append((i, executor.submit(DocumentLoader._ocr_page, doc, i)))
+                else:
+                    pending.append((i, text))
+
+                while pending and (len(pending) > max_pending or not isinstance(pending[0][1], Future)
+                                   or pending[0][1].done()):
+                    yield DocumentLoader._pending_page(*pending.popleft())
+
+            while pending:
+                yield DocumentLoader._pending_page(*pending.popleft())
+
+    @staticmethod
+    def _pending_page(i: int, text) -> dict:
+        if isinstance(text, Future):
+            text = text.result()[1]
+        return {"page": i + 1, "text": text}
+
     @staticmethod
     def _load_docx(file_path: Path) -> dict:
         """Load DOCX and split by page breaks or sections"""
@@ -0,0 +1,290 @@
+"""
+Content-addressed, persistent cache of embedding vectors.
+
+Vectors are keyed by a 128-bit blake2b hash of (model name, normalized text),
+so re-uploading a document (or a revision sharing most of its chunks) and
+asking the same question again skip SentenceTransformer.encode entirely.
+
+On disk each model keeps its entries in numbered generations under
+EMBED_CACHE_DIR: <model>-<n>.keys holds 16-byte keys and <model>-<n>.vec the
+float32 vectors in the same order. Vectors are written before their keys, so
+a key on disk always has its vector; a torn tail from a crash is ignored.
+New entries are appended to the newest generation. Once it holds half of
+EMBED_CACHE_MAX_MB, a fresh generation is started and the one before it is
+deleted, so the cache never takes more than the budget on disk, and entries
+still being hit are copied forward before their generation goes. Only the
+keys of the (at most two) live generations are read into memory; vectors are
+fetched with pread on a miss in the in-memory LRU front. Writes from several
+worker processes are serialized with flock on <model>.lock, and each process
+picks up the others' entries and generations when it misses.
+"""
+from collections import OrderedDict
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+import unicodedata
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EMBED_CACHE_DIR = Path(os.getenv("EMBED_CACHE_DIR", "data/embedding_cache"))
+EMBED_CACHE_MEMORY_ITEMS = int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "20000"))
+# Disk budget per model (~170k all-MiniLM-L6-v2 vectors at 256 MB); the key
+# index each process holds in memory grows with it
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "256"))
+
+KEY_BYTES = 16
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form for keying: NFC, whitespace runs collapsed, ends stripped."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class _Generation:
+    """One generation's pair of append-only files and the index of its keys."""
+
+    def __init__(self, directory: Path, stem: str, number: int, row_bytes: int, create: bool = False):
+        self.number = number
+        self.keys_path = directory / f"{stem}-{number}.keys"
+        self.vectors_path = directory / f"{stem}-{number}.vec"
+        self.row_bytes = row_bytes
+        flags = os.O_RDWR | os.O_APPEND | (os.O_CREAT if create else 0)
+        # Opened without O_CREAT, a generation another process just deleted
+        # raises FileNotFoundError instead of coming back empty
+        self.vectors_fd = os.open(self.vectors_path, flags, 0o644)
+        try:
+            self.keys_fd = os.open(self.keys_path, flags, 0o644)
+        except OSError:
+            os.close(self.vectors_fd)
+            raise
+        self.rows: Dict[bytes, int] = {}  # key -> row in the files
+        self.scanned = 0  # rows of the files indexed into rows
+
+    def scan(self) -> int:
+        """Index keys appended since the last scan; returns the committed row count."""
+        rows = min(
+            os.fstat(self.keys_fd).st_size // KEY_BYTES,
+            os.fstat(self.vectors_fd).st_size // self.row_bytes,
+        )
+        known = self.scanned
+        if rows > known:
+            data = os.pread(self.keys_fd, (rows - known) * KEY_BYTES, known * KEY_BYTES)
+            for i in range(rows - known):
+                self.rows.setdefault(data[i * KEY_BYTES:(i + 1) * KEY_BYTES], known + i)
+            self.scanned = rows
+        return rows
+
+    def read(self, row: int) -> np.ndarray:
+        return np.frombuffer(os.pread(self.vectors_fd, self.row_bytes, row * self.row_bytes), dtype=np.float32)
+
+    def append(self, entries: Dict[bytes, np.ndarray]):
+        """Append entries not stored yet; only with the flock held."""
+        start = self.scan()
+        # Appends land after a torn tail, so cut it off first
+        if os.fstat(self.keys_fd).st_size > start * KEY_BYTES:
+            os.ftruncate(self.keys_fd, start * KEY_BYTES)
+        if os.fstat(self.vectors_fd).st_size > start * self.row_bytes:
+            os.ftruncate(self.vectors_fd, start * self.row_bytes)
+        entries = {k: v for k, v in entries.items() if k not in self.rows}
+        if not entries:
+            return
+        os.write(self.vectors_fd, np.stack(list(entries.values())).tobytes())
+        os.write(self.keys_fd, b"".join(entries.keys()))
+        for i, key in enumerate(entries):
+            self.rows[key] = start + i
+        self.scanned = start + len(entries)
+
+    def nbytes(self) -> int:
+        return self.scanned * (KEY_BYTES + self.row_bytes)
+
+    def close(self):
+        os.close(self.keys_fd)
+        os.close(self.vectors_fd)
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, dim: int, directory: Path = EMBED_CACHE_DIR,
+                 memory_items: int = EMBED_CACHE_MEMORY_ITEMS, max_bytes: int = EMBED_CACHE_MAX_MB * 1024 * 1024):
+        self.model_name = model_name
+        self.dim = dim
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.stem = model_name.replace("/", "_")
+        self._row_bytes = 4 * dim
+        self._generations: List[_Generation] = []  # newest first, at most two
+        self._lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.rotations = 0
+
+        directory.mkdir(parents=True, exist_ok=True)
+        self._lock_fd = os.open(directory / f"{self.stem}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        with self._lock:
+            self._sync()
+        logger.info(f"Embedding cache for {model_name}: {self._entries()} entries on disk")
+
+    def key(self, text: str) -> bytes:
+        data = f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.blake2b(data, digest_size=KEY_BYTES).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached vector per text, or None where it has not been embedded yet."""
+        keys = [self.key(t) for t in texts]
+        results: List[Optional[np.ndarray]] = []
+        promote: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            checked = rescanned = False
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    self.memory_hits += 1
+                    results.append(vector)
+                    continue
+                if not checked:
+                    checked = True
+                    if self._newest_on_disk() != self._newest():
+                        # Rotated by another worker: stop reading the deleted generation
+                        self._sync()
+                found = self._find(key)
+                if found is None and not rescanned:
+                    # Another worker may have embedded it (or rotated) since we last looked
+                    self._sync()
+                    rescanned = True
+                    found = self._find(key)
+                if found is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                generation, row = found
+                vector = generation.read(row)
+                if generation is not self._generations[0]:
+                    # Still in use: keep it when its generation is deleted
+                    promote[key] = vector
+                self._remember(key, vector)
+                self.disk_hits += 1
+                results.append(vector)
+            if promote:
+                self._append(promote)
+        return results
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            fresh = {}
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                self._remember(key, vector)
+                if self._find(key) is None:
+                    fresh[key] = vector
+            if fresh:
+                self._append(fresh)
+
+    def _find(self, key: bytes):
+        for generation in self._generations:
+            row = generation.rows.get(key)
+            if row is not None:
+                return generation, row
+        return None
+
+    def _append(self, entries: Dict[bytes, np.ndarray]):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            self._sync(create=True)
+            current = self._generations[0]
+            current.append(entries)
+            if current.nbytes() > self.max_bytes // 2:
+                self._rotate()
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _rotate(self):
+        """Start a new generation and delete every older one but the current; flock held."""
+        current = self._generations[0]
+        for number in self._numbers_on_disk():
+            if number < current.number:
+                for suffix in (".keys", ".vec"):
+                    (self.directory / f"{self.stem}-{number}{suffix}").unlink(missing_ok=True)
+        for generation in self._generations[1:]:
+            generation.close()
+        self._generations = [
+            _Generation(self.directory, self.stem, current.number + 1, self._row_bytes, create=True), current,
+        ]
+        self._set_newest_on_disk(current.number + 1)
+        self.rotations += 1
+        logger.info(f"Embedding cache for {self.model_name}: started generation {current.number + 1}, "
+                    f"dropped those before {current.number}")
+
+    def _newest(self) -> int:
+        return self._generations[0].number if self._generations else 0
+
+    def _newest_on_disk(self) -> int:
+        """Newest generation number, which the lock file holds; cheaper than listing."""
+        data = os.pread(self._lock_fd, 20, 0).strip()
+        return int(data) if data else 0
+
+    def _set_newest_on_disk(self, number: int):
+        os.pwrite(self._lock_fd, f"{number:>20}".encode(), 0)
+
+    def _numbers_on_disk(self) -> List[int]:
+        prefix = f"{self.stem}-"
+        names = os.listdir(self.directory)
+        return sorted(
+            int(name[len(prefix):-len(".keys")]) for name in names
+            if name.startswith(prefix) and name.endswith(".keys") and name[len(prefix):-len(".keys")].isdigit()
+        )
+
+    def _sync(self, create: bool = False):
+        """Follow the two newest generations on disk and index their new keys. Only
+        with the flock held may create=True start the first generation."""
+        numbers = self._numbers_on_disk()[-2:][::-1]
+        if not numbers and create:
+            numbers = [1]
+            self._set_newest_on_disk(1)
+        opened = {g.number: g for g in self._generations}
+        generations = []
+        for number in numbers:
+            generation = opened.pop(number, None)
+            if generation is None:
+                try:
+                    generation = _Generation(self.directory, self.stem, number, self._row_bytes,
+                                             create=create and number == numbers[0])
+                except FileNotFoundError:
+                    continue  # rotated away meanwhile
+            generations.append(generation)
+        for generation in opened.values():
+            generation.close()
+        self._generations = generations
+        for generation in generations:
+            generation.scan()
+
+    def _entries(self) -> int:
+        return sum(len(g.rows) for g in self._generations)
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.memory_items:
+            self._lru.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": self._entries(),
+            "disk_bytes": sum(g.nbytes() for g in self._generations),
+            "max_bytes": self.max_bytes,
+            "rotations": self.rotations,
+            "memory_entries": len(self._lru),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
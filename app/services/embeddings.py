@@ -1,15 +1,110 @@
 """
 Singleton embedding service - ensures only ONE model is loaded in memory
 """
+from concurrent.futures import Future
 from typing import List
+import asyncio
 import logging
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+from app.services.embedding_cache import EmbeddingCache
+from app.services.executors import embed_executor
+from app.services.onnx_embedder import EMBED_ONNX_MIN_COSINE, OnnxEmbedder, onnx_dir_for
 
 logger = logging.getLogger(__name__)
 
+# Concurrent small requests (chat queries) are coalesced into one encode()
+# of up to EMBED_MAX_BATCH texts, waiting at most EMBED_MAX_WAIT_MS for company.
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+# Persist vectors by content hash so unchanged chunks and repeated queries are never re-encoded
+EMBED_CACHE = os.getenv("EMBED_CACHE", "1") == "1"
+# "torch" serves the SentenceTransformer model; "onnx" serves its int8 ONNX export
+# (python -m app.scripts.export_onnx_embedder), falling back to torch if it is missing.
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+
+
+class EmbeddingBatcher:
+    """Queue plus worker thread that runs one encode() per batch of requests."""
+
+    def __init__(self, encode, max_batch: int = EMBED_MAX_BATCH, max_wait_ms: float = EMBED_MAX_WAIT_MS):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+
+    def submit(self, texts: List[str]) -> Future:
+        """Queue texts for embedding; the future resolves to their vectors."""
+        future = Future()
+        self._queue.put((texts, future))
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+        return future
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [(texts, f) for texts, f in self._collect() if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            texts = [t for item_texts, _ in batch for t in item_texts]
+            try:
+                vectors = self.encode(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch": self.texts / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait_ms,
+        }
+
 
 class EmbeddingService:
     _instance = None
     _model = None
+    _backend = None
+    _batcher = None
+    _cache = None
+    _cache_lock = threading.Lock()
 
     def __new__(cls, model_name: str = "all-MiniLM-L6-v2"):
         if cls._instance is None:
@@ -20,13 +115,88 @@ class EmbeddingService:
     @property
     def model(self):
         if EmbeddingService._model is None:
-            # Lazy import — sentence_transformers pulls in PyTorch (~60 s to import).
-            # Deferring to first use cuts server startup from ~76 s to ~5 s.
-            from sentence_transformers import SentenceTransformer
-            logger.info("Loading embedding model %s", self.model_name)
-            EmbeddingService._model = SentenceTransformer(self.model_name)
-            logger.info("Embedding model ready")
+            if EMBED_BACKEND == "onnx":
+                EmbeddingService._model = self._load_onnx()
+            if EmbeddingService._model is None:
+                # Lazy import — sentence_transformers pulls in PyTorch (~60 s to import).
+                # Deferring to first use cuts server startup from ~76 s to ~5 s.
+                from sentence_transformers import SentenceTransformer
+                logger.info("Loading embedding model %s", self.model_name)
+                EmbeddingService._model = SentenceTransformer(self.model_name)
+                EmbeddingService._backend = "torch"
+            logger.info(f"Embedding model ready ({EmbeddingService._backend})")
         return EmbeddingService._model
 
+    def _load_onnx(self):
+        model_dir = onnx_dir_for(self.model_name)
+        if not model_dir.exists():
+            logger.warning(f"No ONNX export of {self.model_name} in {model_dir}, using torch")
+            return None
+        logger.info(f"Loading ONNX embedding model from {model_dir}")
+        embedder = OnnxEmbedder(model_dir)
+        # Re-check against the torch reference vectors: a runtime upgrade must not
+        # silently drift queries away from the vectors already in the indexes
+        cosine = embedder.validate()
+        if cosine < EMBED_ONNX_MIN_COSINE:
+            logger.error(f"ONNX embeddings drifted from torch (min cosine {cosine:.4f}), using torch")
+            return None
+        EmbeddingService._backend = "onnx"
+        return embedder
+
+    @property
+    def batcher(self) -> EmbeddingBatcher:
+        if EmbeddingService._batcher is None:
+            # The batch is looked up in the cache on the worker thread, so small
+            # requests never wait on embed_executor just to find a cached vector
+            EmbeddingService._batcher = EmbeddingBatcher(self._embed_cached)
+        return EmbeddingService._batcher
+
+    def _encode(self, texts: List[str]):
+        return self.model.encode(texts, show_progress_bar=False, batch_size=64)
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        with EmbeddingService._cache_lock:
+            if EmbeddingService._cache is None:
+                dim = self.model.get_sentence_embedding_dimension()
+                # int8 vectors are close to, not bit-equal with, torch's; keep them apart
+                name = self.model_name if self._backend == "torch" else f"{self.model_name}-{self._backend}"
+                EmbeddingService._cache = EmbeddingCache(name, dim)
+        return EmbeddingService._cache
+
+    def submit(self, texts: List[str]) -> Future:
+        """Embed texts on the batching worker; returns a future of their vectors."""
+        return self.batcher.submit(texts)
+
+    def _split_cached(self, texts: List[str]):
+        """Cached vectors (None where missing) and the distinct texts still to encode."""
+        if not EMBED_CACHE:
+            return [None] * len(texts), list(dict.fromkeys(texts))
+        cached = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        return cached, missing
+
+    def _merge_cached(self, texts: List[str], cached: list, missing: List[str], encoded) -> np.ndarray:
+        if missing:
+            if EMBED_CACHE:
+                self.cache.put_many(missing, encoded)
+            by_text = dict(zip(missing, encoded))
+            cached = [v if v is not None else by_text[t] for t, v in zip(texts, cached)]
+        return np.vstack(cached).astype("float32")
+
+    def _embed_cached(self, texts: List[str]) -> np.ndarray:
+        cached, missing = self._split_cached(texts)
+        encoded = self._encode(missing) if missing else None
+        return self._merge_cached(texts, cached, missing, encoded)
+
     def embed_texts(self, texts: List[str]):
-        return self.model.encode(texts, show_progress_bar=False, batch_size=64)
\ No newline at end of file
+        if len(texts) >= self.batcher.max_batch:
+            # Whole documents already fill a batch; only small requests gain from waiting
+            return self._embed_cached(texts)
+        return self.submit(texts).result()
+
+    async def embed_texts_async(self, texts: List[str]):
+        """embed_texts for coroutines: waits for the batch without blocking the event loop."""
+        if len(texts) >= self.batcher.max_batch:
+            return await embed_executor.run(self._embed_cached, texts)
+        return await asyncio.wrap_future(self.submit(texts))
@@ -0,0 +1,102 @@
+"""
+Bounded thread pools for the CPU-bound work behind the API routes.
+
+Embedding and vector search (FAISS, store loads from disk) take tens to
+hundreds of milliseconds. Run inline in an async route they stall every other
+request and WebSocket stream on the worker, so routes await them here instead.
+Each pool admits at most workers + max_queue tasks; past that, submissions
+fail fast with ExecutorSaturated (answered with 503) instead of queueing
+unbounded latency. Queue depth and the time tasks wait for a worker are
+tracked so the pools can be sized from /api/health/executors.
+"""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import os
+import threading
+import time
+
+EMBED_EXECUTOR_WORKERS = int(os.getenv("EMBED_EXECUTOR_WORKERS", "2"))
+EMBED_EXECUTOR_QUEUE = int(os.getenv("EMBED_EXECUTOR_QUEUE", "32"))
+SEARCH_EXECUTOR_WORKERS = int(os.getenv("SEARCH_EXECUTOR_WORKERS", "4"))
+SEARCH_EXECUTOR_QUEUE = int(os.getenv("SEARCH_EXECUTOR_QUEUE", "64"))
+
+WAIT_SAMPLES = 1000  # recent queue waits kept for the percentiles
+
+
+class ExecutorSaturated(RuntimeError):
+    """Raised when a pool already holds as many tasks as it may queue."""
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._waits: "deque[float]" = deque(maxlen=WAIT_SAMPLES)  # seconds from submit to start
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._queued + self._running >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(f"The {self.name} executor is busy, try again shortly")
+            self._queued += 1
+            self.max_queued = max(self.max_queued, self._queued)
+        submitted = time.monotonic()
+
+        def task():
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._waits.append(time.monotonic() - submitted)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self.completed += 1
+
+        future = self._pool.submit(task)
+        future.add_done_callback(self._release_cancelled)
+        return future
+
+    def _release_cancelled(self, future: Future):
+        # A task cancelled while queued (its awaiting request went away) never starts
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and await its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "running": self._running,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+        if waits:
+            stats.update({
+                "wait_ms_mean": 1000 * sum(waits) / len(waits),
+                "wait_ms_p95": 1000 * waits[int(0.95 * (len(waits) - 1))],
+                "wait_ms_max": 1000 * waits[-1],
+            })
+        return stats
+
+
+embed_executor = BoundedExecutor("embed", EMBED_EXECUTOR_WORKERS, EMBED_EXECUTOR_QUEUE)
+search_executor = BoundedExecutor("search", SEARCH_EXECUTOR_WORKERS, SEARCH_EXECUTOR_QUEUE)
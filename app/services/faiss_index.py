@@ -0,0 +1,295 @@
+"""
+Construction, inspection and I/O of the FAISS indexes behind FAISSVectorStore.
+
+Every index is wrapped in IndexIDMap2 so vectors are addressed by stable
+64-bit chunk ids rather than row positions. What sits inside is described by an
+IndexSpec: its search structure (flat, hnsw, ivf_flat, ivf_pq), how vectors are
+stored (float32, int8 scalar-quantized "sq8", or product-quantized "pq"), and
+whether full-precision vectors are kept alongside compressed codes for an exact
+re-rank of the top candidates.
+"""
+import faiss
+import math
+import os
+import numpy as np
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+# Index a user's store is promoted to once it holds VECTOR_INDEX_PROMOTE_AT
+# vectors: "hnsw", "ivf_flat", "ivf_pq", or "flat" to always brute-force.
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+VECTOR_INDEX_PROMOTE_AT = int(os.getenv("VECTOR_INDEX_PROMOTE_AT", "50000"))
+
+# Opt-in compressed vector storage: "float32" (default), "sq8" (4x smaller) or
+# "pq" (32x smaller; HNSW/IVF only, flat stores use sq8). Small stores stay float32 until VECTOR_COMPRESS_AT so the
+# quantizer is trained on a representative sample.
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float32")
+VECTOR_COMPRESS_AT = int(os.getenv("VECTOR_COMPRESS_AT", "2000"))
+# When > 0, compressed indexes also keep float32 vectors and re-rank
+# k * VECTOR_RERANK_FACTOR compressed candidates by exact distance.
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "0"))
+
+# Filtered searches over at most this many chunks skip the index and compare
+# against the selected vectors directly, which is exact and never comes up short.
+VECTOR_FILTER_EXACT_MAX = int(os.getenv("VECTOR_FILTER_EXACT_MAX", "4096"))
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+DEFAULT_EF_SEARCH = 64
+DEFAULT_NPROBE = 16
+PQ_SUBQUANTIZERS = 48  # 384 dims -> 8 dims per 8-bit sub-quantizer
+MIN_POINTS_PER_CENTROID = 39  # below this faiss k-means warns of under-training
+PQ_MIN_TRAIN = 256 * MIN_POINTS_PER_CENTROID
+SQ_RANGE_MARGIN = 0.2  # widen trained per-dim ranges so later vectors rarely clip
+KMEANS_ITERATIONS = 20
+# id map entry (8) + unordered_map node and bucket for the reverse map (~40)
+ID_MAP_BYTES_PER_VECTOR = 48
+
+# Flat and HNSW storage is only mapped by IO_FLAG_MMAP_IFC (faiss >= 1.9); older
+# builds fall back to IO_FLAG_MMAP. IVF inverted lists are mapped by IO_FLAG_MMAP
+# and refuse the IFC flag, so the flag is picked from the file's type tag.
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+_IVF_MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+_CODECS = {"float32": "Flat", "sq8": "SQ8", "pq": f"PQ{PQ_SUBQUANTIZERS}"}
+
+
+class IndexSpec(NamedTuple):
+    structure: str = "flat"
+    storage: str = "float32"
+    rerank: bool = False
+
+
+# IndexIDMap2 header: fourcc, d, ntotal, 2 dummies, is_trained, metric_type
+_IDMAP_HEADER_BYTES = 4 + 4 + 8 + 8 + 8 + 1 + 4
+
+
+def read_index(path: Path, mmap: bool = False):
+    if not mmap:
+        return faiss.read_index(str(path))
+    with open(path, "rb") as f:
+        header = f.read(_IDMAP_HEADER_BYTES + 4)
+    fourcc = header[:4]
+    if fourcc in (b"IxM2", b"IxMp"):
+        fourcc = header[_IDMAP_HEADER_BYTES:]
+    flags = _IVF_MMAP_FLAGS if fourcc.startswith(b"Iw") else _MMAP_FLAGS
+    return faiss.read_index(str(path), flags)
+
+
+def empty_index(dim: int):
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+
+def _nlist_for(ntotal: int) -> int:
+    # ~4*sqrt(N) lists (sqrt(N)/4 points each), but never fewer than
+    # MIN_POINTS_PER_CENTROID training points per list on small libraries
+    return max(1, min(65536, int(4 * math.sqrt(ntotal)), ntotal // MIN_POINTS_PER_CENTROID))
+
+
+def _crossed(ntotal: int, threshold: int, active: bool) -> bool:
+    """Threshold with hysteresis: switch on at threshold, off below half of it."""
+    return ntotal >= (threshold // 2 if active else threshold)
+
+
+def _inner(index):
+    """Strip the id-map wrapper."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def _base(index):
+    """Strip the id-map and re-rank wrappers, if any."""
+    index = _inner(index)
+    if isinstance(index, faiss.IndexRefine):
+        return faiss.downcast_index(index.base_index)
+    return index
+
+
+def index_spec(index) -> IndexSpec:
+    base = _base(index)
+    rerank = isinstance(_inner(index), faiss.IndexRefine)
+
+    if isinstance(base, faiss.IndexHNSW):
+        structure, codes = "hnsw", faiss.downcast_index(base.storage)
+    else:
+        ivf = faiss.try_extract_index_ivf(base)
+        if ivf is not None:
+            codes = faiss.downcast_index(ivf)
+            structure = "ivf_pq" if isinstance(codes, faiss.IndexIVFPQ) else "ivf_flat"
+        else:
+            structure, codes = "flat", base
+
+    if isinstance(codes, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        storage = "sq8"
+    elif isinstance(codes, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        storage = "pq"
+    else:
+        storage = "float32"
+    return IndexSpec(structure, storage, rerank)
+
+
+def normalize_spec(structure: str, storage: str, rerank: bool, ntotal: int) -> IndexSpec:
+    """Fold a requested structure/storage combination into one faiss can build."""
+    if storage == "pq" and (structure == "flat" or ntotal < PQ_MIN_TRAIN):
+        # Flat IndexPQ can't take the id selectors filtered search relies on,
+        # and PQ needs enough points to train 256 centroids per sub-quantizer
+        storage = "sq8"
+    # IVF with PQ codes *is* ivf_pq, whichever way it was asked for
+    if structure in ("ivf_flat", "ivf_pq"):
+        structure = "ivf_pq" if storage == "pq" else "ivf_flat"
+    return IndexSpec(structure, storage, rerank and storage != "float32")
+
+
+def target_spec(index, ntotal: Optional[int] = None) -> Optional[IndexSpec]:
+    """The spec index should be rebuilt as under the current settings, or None.
+
+    ntotal overrides index.ntotal, e.g. to count vectors still in segments.
+    """
+    ntotal = index.ntotal if ntotal is None else ntotal
+    current = index_spec(index)
+
+    promoted = VECTOR_INDEX_TYPE != "flat" and _crossed(
+        ntotal, VECTOR_INDEX_PROMOTE_AT, current.structure != "flat"
+    )
+    structure = VECTOR_INDEX_TYPE if promoted else "flat"
+
+    compressed = current.storage != "float32"
+    if VECTOR_STORAGE == "float32" and compressed:
+        storage = current.storage  # decompressing is an explicit migration
+    elif VECTOR_STORAGE == "float32" or not _crossed(ntotal, VECTOR_COMPRESS_AT, compressed):
+        storage = "float32"
+    else:
+        storage = VECTOR_STORAGE
+    if structure == "ivf_pq":
+        storage = "pq"
+
+    wanted = normalize_spec(structure, storage, VECTOR_RERANK_FACTOR > 0, ntotal)
+
+    if wanted != current:
+        return wanted
+    if structure.startswith("ivf"):
+        # Centroids trained on a much smaller library make lists lopsided
+        if _nlist_for(ntotal) >= 2 * faiss.extract_index_ivf(index).nlist:
+            return wanted
+    return None
+
+
+def build_index(spec: IndexSpec, dim: int, vectors: np.ndarray, ids: np.ndarray):
+    """Create an id-mapped index for spec, train it if needed and add vectors under ids."""
+    codec = _CODECS[spec.storage]
+    if spec.structure == "flat":
+        factory = codec
+    elif spec.structure == "hnsw":
+        factory = f"HNSW{HNSW_M},{codec}"
+    elif spec.structure in ("ivf_flat", "ivf_pq"):
+        factory = f"IVF{_nlist_for(len(vectors))},{codec}"
+    else:
+        raise ValueError(f"Unknown vector index type: {spec.structure}")
+    if spec.rerank:
+        factory += ",RFlat"
+
+    inner = faiss.index_factory(dim, factory)
+    base = _base(inner)
+
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    sq = _scalar_quantizer(base)
+    if sq is not None:
+        sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+        sq.rangestat_arg = SQ_RANGE_MARGIN
+
+    if not inner.is_trained:
+        inner.train(vectors)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        # Keeps reconstruct() working, which retraining relies on
+        ivf.make_direct_map()
+
+    index = faiss.IndexIDMap2(inner)
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def export_vectors(index) -> Tuple[np.ndarray, np.ndarray]:
+    """All (ids, vectors) of an id-mapped index, in insertion order.
+
+    Exact for float32 and re-rank storage, approximate for compressed codes.
+    """
+    ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+    vectors = _inner(index).reconstruct_n(0, index.ntotal)
+    return ids, vectors
+
+
+def _scalar_quantizer(base):
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    if isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return base.sq
+    return None
+
+
+def search_params(index, ef_search: Optional[int] = None, nprobe: Optional[int] = None,
+                  rerank_factor: Optional[int] = None, sel=None):
+    """Search parameters for index; sel restricts results to the chunk ids it selects.
+
+    The caller must keep sel alive until the search returns.
+    """
+    spec = index_spec(index)
+    if spec.structure == "hnsw":
+        params = faiss.SearchParametersHNSW(efSearch=ef_search or DEFAULT_EF_SEARCH)
+    elif spec.structure.startswith("ivf"):
+        params = faiss.SearchParametersIVF(nprobe=nprobe or DEFAULT_NPROBE)
+    else:
+        params = faiss.SearchParameters() if sel is not None else None
+
+    if spec.rerank:
+        if sel is not None:
+            # IndexIDMap2 translates chunk ids to row ids only on the params it
+            # is handed, and IndexRefine ignores those; translate for the base
+            params.sel = faiss.IDSelectorTranslated(index.id_map, sel)
+        factor = rerank_factor or VECTOR_RERANK_FACTOR
+        refine = faiss.IndexRefineSearchParameters(k_factor=max(factor, 1))
+        if params is not None:
+            refine.base_index_params = params
+        params = refine
+    elif sel is not None:
+        params.sel = sel
+    return params
+
+
+def exact_search(query_vector: np.ndarray, vectors: np.ndarray, ids: np.ndarray, k: int) -> np.ndarray:
+    """Exact top-k of ids by L2 distance between query_vector and their vectors."""
+    _, nearest = faiss.knn(query_vector, vectors, min(k, len(ids)))
+    return ids[nearest[0]]
+
+
+def kmeans_medoids(vectors: np.ndarray, k: int, seed: int = 1234) -> np.ndarray:
+    """Positions of the vectors nearest to each of k k-means centroids, largest cluster first."""
+    k = max(1, min(k, len(vectors)))
+    if k == len(vectors):
+        return np.arange(len(vectors))
+    kmeans = faiss.Kmeans(vectors.shape[1], k, niter=KMEANS_ITERATIONS, seed=seed, min_points_per_centroid=1)
+    kmeans.train(vectors)
+    _, assignment = kmeans.index.search(vectors, 1)
+    sizes = np.bincount(assignment[:, 0], minlength=k)
+    _, nearest = faiss.knn(kmeans.centroids, vectors, 1)
+    order = np.argsort(-sizes, kind="stable")
+    medoids = nearest[order[sizes[order] > 0], 0]
+    # Two centroids can share a nearest vector; keep its first (largest) cluster
+    _, first = np.unique(medoids, return_index=True)
+    return medoids[np.sort(first)]
+
+
+def id_map_bytes(index) -> int:
+    """Heap held by the IndexIDMap2 id map and its reverse hash map, mapped or not."""
+    return index.ntotal * ID_MAP_BYTES_PER_VECTOR
+
+
+def vector_bytes(index) -> int:
+    """Approximate in-memory size of the stored codes and the id maps."""
+    spec = index_spec(index)
+    per_vector = {"float32": 4 * index.d, "sq8": index.d, "pq": PQ_SUBQUANTIZERS}[spec.storage]
+    if spec.rerank:
+        per_vector += 4 * index.d
+    return index.ntotal * per_vector + id_map_bytes(index)
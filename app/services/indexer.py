@@ -1,46 +1,125 @@
-from pathlib import Path
-import numpy as np
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, Iterable, List
 
 from app.services.embeddings import EmbeddingService
-from app.services.vector_store import FAISSVectorStore
+from app.services.vector_store import store_path_for
+from app.services.store_registry import store_registry
 from app.services.chunker import TextChunker
 
+logger = logging.getLogger(__name__)
+
+# Chunks embedded and committed together; each batch is searchable once committed
+INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "256"))
+# Batches the loader/chunker may run ahead of the embedder
+INGEST_PIPELINE_DEPTH = int(os.getenv("INGEST_PIPELINE_DEPTH", "2"))
+
+_END = object()
+
 
 class Indexer:
     def __init__(self, user_id: str):
         self.user_id = user_id
         self.embedding_service = EmbeddingService()
-        self.store_path = Path(f"data/vector_store/{user_id}")
-    
+        self.store_path = store_path_for(user_id)
+
     def index_document(self, document_data: dict, document_id: str) -> int:
         """Index a document into user-specific vectorstore with document_id"""
-        # Chunk the document
-        chunker = TextChunker()
-        chunks = chunker.chunk_document(document_data)
-        
-        if len(chunks) == 0:
-            return 0
-        
-        # Generate embeddings
-        texts = [chunk["text"] for chunk in chunks]
-        vectors = self.embedding_service.embed_texts(texts)
-        
-        # Load existing vectorstore or create new one
+        return self.index_pages(document_data["filename"], document_data["pages"], document_id)
+
+    def index_pages(self, filename: str, pages: Iterable[Dict], document_id: str) -> int:
+        """Chunk, embed and index pages as they arrive from the loader.
+
+        Loading and chunking run on a producer thread, at most
+        INGEST_PIPELINE_DEPTH batches ahead; batches of INGEST_BATCH_CHUNKS
+        are embedded and committed as they come, so memory stays bounded and
+        the first chunks are searchable before the last pages are read. If
+        anything fails, the chunks already committed are removed again.
+        """
+        started = time.perf_counter()
+        batches: "queue.Queue" = queue.Queue(maxsize=INGEST_PIPELINE_DEPTH)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce, args=(filename, pages, batches, stop), name="ingest-chunker", daemon=True
+        )
+
+        # Shared vectorstore (warm in the registry, or loaded/created now)
         self.store_path.mkdir(parents=True, exist_ok=True)
-        vector_store = FAISSVectorStore(dim=384, store_path=self.store_path)
-        vector_store.load()
-        
-        # Add document_id to each chunk's metadata
-        metadatas = []
-        for chunk in chunks:
-            metadata = chunk["metadata"].copy()
-            metadata["document_id"] = document_id  
-            metadatas.append(metadata)
-        
-        # Add new vectors
-        vector_store.add(vectors.astype("float32"), metadatas)
-        
-        # Save
-        vector_store.save()
-        
-        return len(chunks)
\ No newline at end of file
+        vector_store = store_registry.get(self.user_id)
+        # Chunks of an earlier, interrupted attempt at this document
+        self._delete(vector_store, document_id)
+
+        num_chunks, first_ms = 0, None
+        producer.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is _END:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+
+                # Generate embeddings
+                vectors = self.embedding_service.embed_texts([chunk["text"] for chunk in batch])
+
+                # Add document_id to each chunk's metadata
+                metadatas = []
+                for chunk in batch:
+                    metadata = chunk["metadata"].copy()
+                    metadata["text"] = chunk["text"]
+                    metadata["document_id"] = document_id
+                    metadatas.append(metadata)
+
+                # Add and commit under the store's write lock, so concurrent uploads
+                # (from any worker process) never overwrite each other's chunks
+                with vector_store.transaction():
+                    vector_store.add(vectors.astype("float32"), metadatas)
+                num_chunks += len(batch)
+                if first_ms is None:
+                    first_ms = round(1000 * (time.perf_counter() - started))
+        except BaseException:
+            stop.set()
+            self._delete(vector_store, document_id)
+            raise
+        finally:
+            producer.join()
+
+        logger.info(
+            f"Indexed {num_chunks} chunks of doc {document_id} in "
+            f"{round(1000 * (time.perf_counter() - started))} ms (first batch searchable after {first_ms} ms)"
+        )
+        return num_chunks
+
+    @staticmethod
+    def _produce(filename: str, pages: Iterable[Dict], batches: "queue.Queue", stop: threading.Event):
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        batch: List[Dict] = []
+        try:
+            for chunk in TextChunker().chunk_pages(filename, pages):
+                batch.append(chunk)
+                if len(batch) >= INGEST_BATCH_CHUNKS:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch and not put(batch):
+                return
+            put(_END)
+        except BaseException as e:
+            put(e)
+
+    @staticmethod
+    def _delete(vector_store, document_id: str):
+        if len(vector_store.chunks.ids_for_documents([document_id])):
+            with vector_store.transaction():
+                vector_store.delete_by_document_id(document_id)
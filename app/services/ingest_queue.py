@@ -0,0 +1,203 @@
+"""
+Durable queue of document ingestion jobs.
+
+Uploads are recorded in a SQLite database on the data volume and picked up by
+the ingestion worker processes (app.services.ingest_worker), so a restart
+loses no work and a burst of uploads is worked off at the pool's pace rather
+than all at once inside the API process. Workers claim jobs under a lease
+that they renew while processing; a job whose worker died is claimable again
+once its lease lapses. Claims favour the user with the fewest running jobs
+and, among those, the one served longest ago, so one user's bulk upload does
+not hold everyone else's documents back. A failed attempt is retried after
+INGEST_RETRY_BASE_S * 2**(attempt - 1) seconds, up to INGEST_MAX_ATTEMPTS.
+Every job row keeps the path of its upload, so the upload can be found and
+removed again whatever happens to the job.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INGEST_QUEUE_PATH = Path(os.getenv("INGEST_QUEUE_PATH", "data/ingest_queue.sqlite3"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_RETRY_BASE_S = float(os.getenv("INGEST_RETRY_BASE_S", "30"))
+INGEST_LEASE_S = float(os.getenv("INGEST_LEASE_S", "300"))
+
+INTERRUPTED_ERROR = "Processing was interrupted repeatedly."
+
+
+class IngestQueue:
+    def __init__(self, path: Path = INGEST_QUEUE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit; multi-statement updates take the write lock with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " document_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, file_path TEXT NOT NULL,"
+                " status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+                " available_at REAL NOT NULL, leased_until REAL, enqueued_at REAL NOT NULL, error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS served (user_id TEXT PRIMARY KEY, served_at REAL NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def enqueue(self, document_id: str, user_id: str, file_path: Path):
+        now = time.time()
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO jobs (document_id, user_id, file_path, status, available_at, enqueued_at)"
+                " VALUES (?, ?, ?, 'queued', ?, ?)",
+                (document_id, user_id, str(file_path), now, now),
+            )
+
+    def claim(self) -> Optional[Dict]:
+        """Lease the next job to run, or None if nothing is due."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT j.* FROM jobs j LEFT JOIN served s ON s.user_id = j.user_id"
+                    " WHERE j.status = 'queued' AND j.available_at <= ?"
+                    " ORDER BY (SELECT COUNT(*) FROM jobs r WHERE r.user_id = j.user_id AND r.status = 'running'),"
+                    " COALESCE(s.served_at, 0), j.enqueued_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, leased_until = ?"
+                        " WHERE document_id = ?",
+                        (now + INGEST_LEASE_S, row["document_id"]),
+                    )
+                    conn.execute("INSERT OR REPLACE INTO served VALUES (?, ?)", (row["user_id"], now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {**dict(row), "attempts": row["attempts"] + 1}
+
+    def expire_leases(self) -> List[Dict]:
+        """Requeue jobs whose worker died mid-job, unless they keep doing so; returns
+        the jobs failed for good, whose documents and uploads the caller must settle."""
+        now = time.time()
+        failed = []
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'running' AND leased_until < ?", (now,)
+                ).fetchall()
+                for row in expired:
+                    logger.warning(f"Ingestion lease of {row['document_id']} expired after attempt {row['attempts']}")
+                    if row["attempts"] >= INGEST_MAX_ATTEMPTS:
+                        conn.execute(
+                            "UPDATE jobs SET status = 'failed', error = ?, leased_until = NULL WHERE document_id = ?",
+                            (INTERRUPTED_ERROR, row["document_id"]),
+                        )
+                        failed.append({**dict(row), "status": "failed", "error": INTERRUPTED_ERROR})
+                    else:
+                        conn.execute(
+                            "UPDATE jobs SET status = 'queued', available_at = ? WHERE document_id = ?",
+                            (now, row["document_id"]),
+                        )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return failed
+
+    def renew(self, document_id: str):
+        with self._lock:
+            self._connect().execute(
+                "UPDATE jobs SET leased_until = ? WHERE document_id = ? AND status = 'running'",
+                (time.time() + INGEST_LEASE_S, document_id),
+            )
+
+    def finish(self, document_id: str, status: str, error: Optional[str] = None) -> bool:
+        """Mark a job done or failed; False if it was cancelled while running."""
+        with self._lock:
+            cursor = self._connect().execute(
+                "UPDATE jobs SET status = ?, error = ?, leased_until = NULL WHERE document_id = ?",
+                (status, error, document_id),
+            )
+        return cursor.rowcount > 0
+
+    def retry(self, job: Dict, error: str) -> bool:
+        """Queue a failed attempt again after a backoff; False once attempts are used
+        up, or if the job was cancelled while running."""
+        if job["attempts"] >= INGEST_MAX_ATTEMPTS:
+            self.finish(job["document_id"], "failed", error)
+            return False
+        delay = INGEST_RETRY_BASE_S * 2 ** (job["attempts"] - 1)
+        with self._lock:
+            cursor = self._connect().execute(
+                "UPDATE jobs SET status = 'queued', error = ?, leased_until = NULL, available_at = ?"
+                " WHERE document_id = ?",
+                (error, time.time() + delay, job["document_id"]),
+            )
+        return cursor.rowcount > 0
+
+    def cancel(self, document_id: str) -> Optional[Dict]:
+        """Drop a job (its document was deleted); returns it if it existed."""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT * FROM jobs WHERE document_id = ?", (document_id,)).fetchone()
+            conn.execute("DELETE FROM jobs WHERE document_id = ?", (document_id,))
+        return dict(row) if row is not None else None
+
+    def recover(self) -> int:
+        """Requeue jobs left running by a previous worker pool; call before starting a new one."""
+        with self._lock:
+            cursor = self._connect().execute(
+                "UPDATE jobs SET status = 'queued', leased_until = NULL, available_at = ? WHERE status = 'running'",
+                (time.time(),),
+            )
+        return cursor.rowcount
+
+    def jobs_by_document(self) -> Dict[str, Dict]:
+        """Status, upload path and error of every job still on record, by document id."""
+        with self._lock:
+            rows = self._connect().execute("SELECT document_id, status, file_path, error FROM jobs").fetchall()
+        return {row["document_id"]: dict(row) for row in rows}
+
+    def purge(self, older_than_s: float = 7 * 86400):
+        """Forget finished jobs after a week."""
+        with self._lock:
+            self._connect().execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND enqueued_at < ?",
+                (time.time() - older_than_s,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connect()
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = conn.execute("SELECT MIN(enqueued_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_queued_s": round(time.time() - oldest, 1) if oldest is not None else None,
+        }
+
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,299 @@
+"""
+Ingestion worker processes: load, chunk, embed and index queued uploads.
+
+The API process only stores the upload and enqueues it (app.services.ingest_queue).
+INGEST_WORKERS processes, started with the API, claim jobs one at a time. Each
+loads its own copy of the embedding model (with torch, several hundred MB of
+resident memory on top of the API's own copy), so the default is a single
+worker; raise it only where memory allows. The pool logs the resident size of
+the API process at start-up and of each worker after every job. Workers
+run at a lower CPU priority (INGEST_NICE) than the API, so a burst of uploads
+does not slow chat down. Only one pool runs per machine, however many API
+processes start: the first takes an exclusive lock and recovers the jobs and
+documents a previous pool left unfinished. The pool checks its workers every
+INGEST_SUPERVISE_S seconds and replaces any that died (killed for memory,
+crashed in a native parser, ...); the job it held is retried once its lease
+lapses. With INGEST_WORKERS=0, run the pool on its own instead:
+
+    python -m app.scripts.ingest_worker --workers 2
+"""
+from pathlib import Path
+import asyncio
+import fcntl
+import glob
+import logging
+import multiprocessing
+import os
+import threading
+from typing import Dict, List, Optional
+
+from app.services.database import get_documents_by_status, update_document_status
+from app.services.document_loader import DocumentLoader
+from app.services.indexer import Indexer
+from app.services.ingest_queue import INGEST_LEASE_S, INGEST_QUEUE_PATH, ingest_queue
+from app.services.llm import close_groq_client
+from app.services.store_registry import store_registry
+from app.services import study_service
+
+logger = logging.getLogger(__name__)
+
+# Each worker holds its own embedding model; see the module docstring
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_POLL_S = float(os.getenv("INGEST_POLL_S", "1"))
+INGEST_NICE = int(os.getenv("INGEST_NICE", "10"))
+INGEST_SUPERVISE_S = float(os.getenv("INGEST_SUPERVISE_S", "5"))
+POOL_LOCK_PATH = INGEST_QUEUE_PATH.with_suffix(".lock")
+# Each upload is kept in UPLOAD_DIR/<user_id>/<upload id>/<filename> until it is indexed
+UPLOAD_DIR = Path("data/uploads")
+
+
+def rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Resident memory of a process (default: this one) in MB; None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+
+def remove_upload(file_path: Path):
+    file_path.unlink(missing_ok=True)
+    try:
+        file_path.parent.rmdir()
+    except OSError:
+        pass
+
+
+def fail_document(document_id: str, file_path: Path, error: str):
+    """Settle a document whose job will not run again: failed, upload removed."""
+    update_document_status(document_id, "failed", error)
+    remove_upload(file_path)
+
+
+def process_job(job: Dict) -> int:
+    """Index one upload; ValueError means retrying would not help."""
+    file_path = Path(job["file_path"])
+    if not file_path.exists():
+        raise ValueError("The uploaded file is no longer available. Please upload it again.")
+    # Pages stream from the loader into the index; nothing holds the whole document
+    pages = DocumentLoader.iter_pages(file_path)
+    num_chunks = Indexer(user_id=job["user_id"]).index_pages(file_path.name, pages, job["document_id"])
+    if num_chunks == 0:
+        raise ValueError("No text could be extracted from this file.")
+    return num_chunks
+
+
+def _delete_vectors(user_id: str, document_id: str):
+    vector_store = store_registry.get(user_id)
+    with vector_store.transaction():
+        vector_store.delete_by_document_id(document_id)
+
+
+class _Worker:
+    def __init__(self):
+        self._background: set = set()  # pre-generation tasks, referenced until done
+
+    async def serve(self, stop_event, parent_pid: Optional[int]):
+        while not (stop_event is not None and stop_event.is_set()):
+            if parent_pid is not None and os.getppid() != parent_pid:
+                logger.warning("Ingestion worker's parent exited; stopping")
+                break
+            for expired in await asyncio.to_thread(ingest_queue.expire_leases):
+                # Its worker kept dying (e.g. a file that crashes the parser)
+                await asyncio.to_thread(fail_document, expired["document_id"], Path(expired["file_path"]),
+                                        expired["error"])
+            job = await asyncio.to_thread(ingest_queue.claim)
+            if job is None:
+                await asyncio.sleep(INGEST_POLL_S)
+                continue
+            await self.run(job)
+        await close_groq_client()
+
+    async def run(self, job: Dict):
+        document_id, user_id = job["document_id"], job["user_id"]
+        file_path = Path(job["file_path"])
+        heartbeat = asyncio.ensure_future(self._heartbeat(document_id))
+        try:
+            num_chunks = await asyncio.to_thread(process_job, job)
+        except ValueError as e:
+            await asyncio.to_thread(ingest_queue.finish, document_id, "failed", str(e))
+            await asyncio.to_thread(fail_document, document_id, file_path, str(e))
+            return
+        except Exception as e:
+            logger.error(f"Ingestion attempt {job['attempts']} failed for doc {document_id}: {e}", exc_info=True)
+            # Out of attempts, or cancelled (deleted) meanwhile: either way the upload goes
+            if not await asyncio.to_thread(ingest_queue.retry, job, str(e)):
+                await asyncio.to_thread(fail_document, document_id, file_path, str(e))
+            return
+        finally:
+            heartbeat.cancel()
+
+        remove_upload(file_path)
+        if not await asyncio.to_thread(ingest_queue.finish, document_id, "done"):
+            # Deleted while it was being indexed
+            await asyncio.to_thread(_delete_vectors, user_id, document_id)
+            logger.info(f"Dropped vectors of doc {document_id}, deleted during ingestion")
+            return
+        await asyncio.to_thread(update_document_status, document_id, "ready")
+        logger.info(f"Ingestion done: {document_id} ({num_chunks} chunks, attempt {job['attempts']}, "
+                    f"worker resident {rss_mb()} MB)")
+
+        if study_service.STUDY_PREGENERATE:
+            task = asyncio.ensure_future(study_service.pregenerate(user_id, [document_id]))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def _heartbeat(self, document_id: str):
+        while True:
+            await asyncio.sleep(INGEST_LEASE_S / 3)
+            await asyncio.to_thread(ingest_queue.renew, document_id)
+
+
+def worker_main(stop_event=None, parent_pid: Optional[int] = None):
+    try:
+        os.nice(INGEST_NICE)
+    except OSError:
+        pass
+    asyncio.run(_Worker().serve(stop_event, parent_pid))
+
+
+def _find_upload(doc: Dict, jobs: Dict[str, Dict]) -> Optional[Path]:
+    """The upload of a document that never got a job (the API stopped between
+    storing it and enqueueing it): the newest one of that filename whose path
+    no other job records."""
+    owned = {job["file_path"] for job in jobs.values()}
+    matches = [
+        path for path in glob.glob(str(UPLOAD_DIR / glob.escape(doc["user_id"]) / "*" / glob.escape(doc["filename"])))
+        if path not in owned
+    ]
+    return Path(max(matches, key=os.path.getmtime)) if matches else None
+
+
+def _recover_orphaned_documents():
+    """Settle documents left "processing" with no job queued or running for them."""
+    jobs = ingest_queue.jobs_by_document()
+    for doc in get_documents_by_status("processing"):
+        job = jobs.get(doc["id"])
+        status = job["status"] if job is not None else None
+        if status in ("queued", "running"):
+            continue
+        if status == "done":
+            # Indexed; only the status update was lost
+            update_document_status(doc["id"], "ready")
+            continue
+        if status == "failed":
+            # Out of attempts; starting over would only fail the same way
+            fail_document(doc["id"], Path(job["file_path"]), job["error"] or "Processing failed.")
+            logger.warning(f"Marked orphaned document {doc['id']} ({doc['filename']}) as failed: {job['error']}")
+            continue
+        file_path = _find_upload(doc, jobs)
+        if file_path is not None:
+            ingest_queue.enqueue(doc["id"], doc["user_id"], file_path)
+            jobs[doc["id"]] = {"status": "queued", "file_path": str(file_path), "error": None}
+            logger.warning(f"Requeued orphaned document {doc['id']} ({doc['filename']}) from {file_path}")
+        else:
+            update_document_status(doc["id"], "failed", "Processing was interrupted. Please upload the file again.")
+            logger.warning(f"Marked orphaned document {doc['id']} ({doc['filename']}) as failed")
+
+
+class IngestWorkerPool:
+    def __init__(self, workers: int = INGEST_WORKERS, target=worker_main):
+        self.workers = workers
+        self.target = target  # run in each worker process as target(stop_event, parent_pid)
+        self._processes: List[multiprocessing.Process] = []
+        self._context = None
+        self._stop = None
+        self._lock_file = None
+        self._monitor: Optional[threading.Thread] = None
+        self._processes_lock = threading.Lock()
+        self.restarts = 0
+
+    def start(self) -> bool:
+        """Start the workers unless another pool already runs on this machine."""
+        if self.workers <= 0:
+            return False
+        POOL_LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(POOL_LOCK_PATH, "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+
+        recovered = ingest_queue.recover()
+        if recovered:
+            logger.info(f"Requeued {recovered} ingestion jobs interrupted by the last shutdown")
+        try:
+            _recover_orphaned_documents()
+        except Exception as e:
+            logger.error(f"Recovering processing documents failed: {e}")
+        ingest_queue.purge()
+
+        # Spawned, not forked: the parent's threads, locks and loaded models stay behind
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+        with self._processes_lock:
+            self._processes = [self._spawn(i) for i in range(self.workers)]
+        self._monitor = threading.Thread(target=self._supervise, args=(self._stop,), name="ingest-supervisor",
+                                         daemon=True)
+        self._monitor.start()
+        logger.info(f"Started {self.workers} ingestion workers (API process resident {rss_mb()} MB; "
+                    f"each worker loads its own embedding model)")
+        return True
+
+    def _spawn(self, i: int) -> multiprocessing.Process:
+        process = self._context.Process(target=self.target, args=(self._stop, os.getpid()), name=f"ingest-{i}")
+        process.start()
+        return process
+
+    def _supervise(self, stop):
+        while not stop.wait(INGEST_SUPERVISE_S):
+            with self._processes_lock:
+                if stop.is_set():
+                    return
+                for i, process in enumerate(self._processes):
+                    if process.is_alive():
+                        continue
+                    process.join()
+                    logger.error(f"Ingestion worker {process.name} (pid {process.pid}) exited with code "
+                                 f"{process.exitcode}; starting a replacement")
+                    self._processes[i] = self._spawn(i)
+                    self.restarts += 1
+
+    def join(self):
+        """Block until stop() is called (e.g. from a signal handler)."""
+        while self._monitor is not None and self._monitor.is_alive():
+            self._monitor.join(1)
+
+    def stop(self, timeout: float = 10):
+        """Let workers finish their current job; a job still running after timeout is
+        killed and picked up again by the next pool."""
+        if self._stop is None:
+            return
+        self._stop.set()
+        # No replacements from here on
+        self._monitor.join()
+        self._monitor = None
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._processes = []
+        self._lock_file.close()
+        self._lock_file = None
+        self._stop = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "alive": sum(p.is_alive() for p in self._processes),
+            "rss_mb": [rss_mb(p.pid) for p in self._processes if p.is_alive()],
+            "restarts": self.restarts,
+            "owner": self._lock_file is not None,
+        }
+
+
+ingest_pool = IngestWorkerPool()
@@ -0,0 +1,91 @@
+"""
+Incremental extraction of array elements from a JSON object arriving in pieces.
+
+LLM JSON responses stream in as arbitrary text fragments. JsonArrayStreamer
+scans them once, character by character, and hands back each object element
+of one top-level array (e.g. "questions") as soon as its closing brace
+arrives, long before the whole document parses.
+"""
+import json
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JsonArrayStreamer:
+    def __init__(self, key: str):
+        self.key = key
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string: Optional[List[str]] = None  # string being read at the top level
+        self._last_string: Optional[str] = None
+        self._armed = False  # the top-level key just read is self.key
+        self._in_array = False
+        self._item: Optional[List[str]] = None  # element being captured
+
+    def feed(self, text: str) -> List[dict]:
+        """Consume the next fragment; returns the elements it completed."""
+        items = []
+        for ch in text:
+            if self._item is not None:
+                self._item.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string is not None:
+                        self._last_string = "".join(self._string)
+                        self._string = None
+                elif self._string is not None:
+                    self._string.append(ch)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._string = []
+            elif ch in "{[":
+                if ch == "[" and self._depth == 1 and self._armed:
+                    self._in_array = True
+                elif ch == "{" and self._in_array and self._depth == 2 and self._item is None:
+                    self._item = [ch]
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._item is not None and self._depth == 2:
+                    item = self._parse("".join(self._item))
+                    if item is not None:
+                        items.append(item)
+                    self._item = None
+                elif self._in_array and self._depth == 1:
+                    self._in_array = self._armed = False
+            elif self._depth == 1 and ch == ":":
+                self._armed = self._last_string == self.key
+            elif self._depth == 1 and ch == ",":
+                self._armed = False
+        return items
+
+    @staticmethod
+    def _parse(text: str) -> Optional[dict]:
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            logger.warning("Skipping a streamed JSON element that does not parse")
+            return None
+        return item if isinstance(item, dict) else None
+
+
+def parse_json_object(text: str) -> dict:
+    """Parse an LLM's JSON answer, tolerating prose or code fences around the object."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end < start:
+            raise
+        return json.loads(text[start:end + 1])
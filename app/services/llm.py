@@ -1,6 +1,7 @@
 import os
-from groq import Groq
-from typing import Generator, Optional, List, Dict
+import httpx
+from groq import AsyncGroq
+from typing import AsyncGenerator, Optional, List, Dict
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -197,6 +198,45 @@ Maintain context from previous messages in the conversation.
 If asked about something harmful or illegal, politely decline."""
 
 
+GROQ_MODEL = "openai/gpt-oss-120b"
+# One pooled client per process: keep-alive connections are reused across
+# requests instead of a TLS handshake per call, and concurrent streams share them
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "100"))
+GROQ_MAX_KEEPALIVE = int(os.getenv("GROQ_MAX_KEEPALIVE", "20"))
+
+# Streams report failures in-band, as their last chunk
+STREAM_ERROR_PREFIX = "Error generating response: "
+
+_groq_client: Optional[AsyncGroq] = None
+
+
+def get_groq_client() -> AsyncGroq:
+    """The process-wide AsyncGroq client, created on first use."""
+    global _groq_client
+    if _groq_client is None:
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError("GROQ_API_KEY environment variable not set")
+        _groq_client = AsyncGroq(
+            api_key=api_key,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=GROQ_MAX_CONNECTIONS,
+                    max_keepalive_connections=GROQ_MAX_KEEPALIVE,
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            ),
+        )
+    return _groq_client
+
+
+async def close_groq_client():
+    global _groq_client
+    if _groq_client is not None:
+        await _groq_client.close()
+        _groq_client = None
+
+
 class LLMService:
     """
     LLM service using Groq's gpt-oss-120b model.
@@ -204,16 +244,10 @@ class LLMService:
     """
 
     def __init__(self, temperature: float = 0.2):
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise ValueError("GROQ_API_KEY environment variable not set")
-
-        self.client = Groq(api_key=api_key)
-        self.model = "openai/gpt-oss-120b"
+        self.client = get_groq_client()
+        self.model = GROQ_MODEL
         self.temperature = temperature
 
-        logger.info(f"LLMService initialized with model {self.model}")
-
     def _build_messages(
         self,
         question: str,
@@ -244,7 +278,7 @@ class LLMService:
         messages.append({"role": "user", "content": question})
         return messages
 
-    def generate_answer(
+    async def generate_answer(
         self, 
         question: str, 
         context: str,
@@ -260,10 +294,10 @@ class LLMService:
         try:
             logger.info(f"Generating answer for user {user_id}")
             
-            chat_history = load_chat_history(user_id, session_id, limit=5)
+            chat_history = await asyncio.to_thread(load_chat_history, user_id, session_id, 5)
             messages = self._build_messages(question, context, chat_history)
             
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=temp,
@@ -278,14 +312,14 @@ class LLMService:
             logger.error(f"Failed to generate answer: {str(e)}", exc_info=True)
             raise Exception(f"Failed to generate answer: {str(e)}")
 
-    def stream_answer(
+    async def stream_answer(
         self, 
         question: str, 
         context: str,
         user_id: str,
         session_id: Optional[str] = None,
         temperature: Optional[float] = None
-    ) -> Generator[str, None, None]:
+    ) -> AsyncGenerator[str, None]:
         """
         Generate answer with streaming (yields chunks in real-time) with chat history.
         """
@@ -294,10 +328,10 @@ class LLMService:
         try:
             logger.info(f"Streaming answer for user {user_id}")
             
-            chat_history = load_chat_history(user_id, session_id, limit=5)
+            chat_history = await asyncio.to_thread(load_chat_history, user_id, session_id, 5)
             messages = self._build_messages(question, context, chat_history)
             
-            stream = self.client.chat.completions.create(
+            stream = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=temp,
@@ -305,7 +339,7 @@ class LLMService:
                 timeout=30
             )
             
-            for chunk in stream:
+            async for chunk in stream:
                 if chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
                     
@@ -313,9 +347,9 @@ class LLMService:
             
         except Exception as e:
             logger.error(f"Streaming failed: {str(e)}", exc_info=True)
-            yield f"Error generating response: {str(e)}"
+            yield f"{STREAM_ERROR_PREFIX}{str(e)}"
 
-    def generate_general_answer(
+    async def generate_general_answer(
         self,
         question: str,
         user_id: str,
@@ -326,9 +360,9 @@ class LLMService:
         temp = temperature if temperature is not None else 0.5
         try:
             logger.info(f"Generating general answer for user {user_id}")
-            chat_history = load_chat_history(user_id, session_id, limit=5)
+            chat_history = await asyncio.to_thread(load_chat_history, user_id, session_id, 5)
             messages = self._build_general_messages(question, chat_history)
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=temp,
@@ -341,33 +375,33 @@ class LLMService:
             logger.error(f"Failed to generate general answer: {str(e)}", exc_info=True)
             raise Exception(f"Failed to generate general answer: {str(e)}")
 
-    def stream_general_answer(
+    async def stream_general_answer(
         self,
         question: str,
         user_id: str,
         session_id: Optional[str] = None,
         temperature: Optional[float] = None
-    ) -> Generator[str, None, None]:
+    ) -> AsyncGenerator[str, None]:
         """Stream a general-knowledge answer (no document context)."""
         temp = temperature if temperature is not None else 0.5
         try:
             logger.info(f"Streaming general answer for user {user_id}")
-            chat_history = load_chat_history(user_id, session_id, limit=5)
+            chat_history = await asyncio.to_thread(load_chat_history, user_id, session_id, 5)
             messages = self._build_general_messages(question, chat_history)
-            stream = self.client.chat.completions.create(
+            stream = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=temp,
                 stream=True,
                 timeout=30
             )
-            for chunk in stream:
+            async for chunk in stream:
                 if chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
             logger.info(f"General streaming completed for user {user_id}")
         except Exception as e:
             logger.error(f"General streaming failed: {str(e)}", exc_info=True)
-            yield f"Error generating response: {str(e)}"
+            yield f"{STREAM_ERROR_PREFIX}{str(e)}"
 
 
 # ============= AUTHENTICATION =============
@@ -0,0 +1,104 @@
+"""
+SentenceTransformer-compatible encoder served by ONNX Runtime.
+
+Loads a model exported (and int8-quantized) by app.scripts.export_onnx_embedder:
+model.onnx, tokenizer.json, embedder.json (pooling settings) and
+validation.npz (reference embeddings from the PyTorch model). Only
+onnxruntime and tokenizers are imported, so there is no PyTorch import on
+cold start and no PyTorch weights held in memory. Embeddings match the
+PyTorch model to within rounding, so existing indexes keep working.
+"""
+import json
+import logging
+import os
+import numpy as np
+from pathlib import Path
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Exported models live in EMBED_ONNX_DIR/<model name>
+EMBED_ONNX_DIR = Path(os.getenv("EMBED_ONNX_DIR", "models/onnx"))
+# 0 lets ONNX Runtime use every core
+EMBED_ONNX_THREADS = int(os.getenv("EMBED_ONNX_THREADS", "0"))
+# Lowest cosine similarity to the PyTorch embedding an exported model may show
+EMBED_ONNX_MIN_COSINE = float(os.getenv("EMBED_ONNX_MIN_COSINE", "0.99"))
+
+MODEL_FILE = "model.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "embedder.json"
+VALIDATION_FILE = "validation.npz"
+
+
+def onnx_dir_for(model_name: str) -> Path:
+    return EMBED_ONNX_DIR / model_name.replace("/", "_")
+
+
+def cosine_similarities(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Row-wise cosine similarity of two equally shaped embedding matrices."""
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+class OnnxEmbedder:
+    def __init__(self, model_dir: Path, threads: int = EMBED_ONNX_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_dir = model_dir
+        with open(model_dir / CONFIG_FILE) as f:
+            self.config = json.load(f)
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_id"], pad_token=self.config["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            str(model_dir / MODEL_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dim"]
+
+    def encode(self, texts: List[str], batch_size: int = 64, **_) -> np.ndarray:
+        """Embed texts like SentenceTransformer.encode (extra keyword arguments are ignored)."""
+        if not texts:
+            return np.zeros((0, self.config["dim"]), dtype=np.float32)
+        # Length-sorted batches keep padding, and so wasted compute, small
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = np.empty((len(texts), self.config["dim"]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            out[rows] = self._encode_batch([texts[i] for i in rows])
+        return out
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feed.items() if k in self._inputs})[0]
+
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            weights = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        if self.config["normalize"]:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def validate(self) -> float:
+        """Minimum cosine similarity to the PyTorch reference embeddings saved at export."""
+        reference = np.load(self.model_dir / VALIDATION_FILE)
+        texts = [str(t) for t in reference["texts"]]
+        return float(cosine_similarities(self.encode(texts), reference["vectors"]).min())
@@ -0,0 +1,185 @@
+"""
+Cache of RAG answers, keyed by what each answer was generated from.
+
+An entry is keyed by (user, retrieved chunk ids, normalized question), so the
+same question over the same chunks is answered without an LLM round trip.
+With the semantic tier on, an exact miss also compares the question's
+embedding (already in the embedding cache from retrieval) with the questions
+answered from the same chunks, and reuses the closest answer at or above
+RESPONSE_CACHE_SIMILARITY. Entries expire after RESPONSE_CACHE_TTL seconds
+and the least recently used are evicted past RESPONSE_CACHE_MAX_ITEMS.
+Deleting or re-indexing a document drops every entry built from it; since
+chunk ids are never reused within a store, stale entries in other worker
+processes stop matching as well.
+"""
+from collections import OrderedDict
+import os
+import re
+import threading
+import time
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.services.embedding_cache import normalize_text
+from app.services.embeddings import EmbeddingService
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_MAX_ITEMS = int(os.getenv("RESPONSE_CACHE_MAX_ITEMS", "2000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "1") == "1"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+
+CacheKey = Tuple[str, Tuple[int, ...], str]
+
+
+def normalize_question(question: str) -> str:
+    return normalize_text(question).lower().rstrip("?!. ")
+
+
+def chunk_key(results: List[Dict]) -> Tuple[int, ...]:
+    """The retrieved chunk set, independent of rank order."""
+    return tuple(sorted(r["chunk_id"] for r in results))
+
+
+def replay_tokens(answer: str) -> List[str]:
+    """Split a cached answer into word-sized pieces to stream like a live one."""
+    return re.findall(r"\s*\S+\s*", answer) or [answer]
+
+
+class _Entry:
+    __slots__ = ("answer", "vector", "documents", "expires")
+
+    def __init__(self, answer: str, vector: Optional[np.ndarray], documents: Set, expires: float):
+        self.answer = answer
+        self.vector = vector
+        self.documents = documents
+        self.expires = expires
+
+
+class ResponseCache:
+    def __init__(self, max_items: int = RESPONSE_CACHE_MAX_ITEMS, ttl: float = RESPONSE_CACHE_TTL,
+                 semantic: bool = RESPONSE_CACHE_SEMANTIC, similarity: float = RESPONSE_CACHE_SIMILARITY):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.semantic = semantic
+        self.similarity = similarity
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        # Secondary indexes: questions answered from one chunk set (semantic
+        # candidates) and entries built from each document (invalidation)
+        self._by_chunks: Dict[Tuple[str, Tuple[int, ...]], Set[CacheKey]] = {}
+        self._by_document: Dict[Tuple[str, str], Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    async def lookup(self, user_id: str, results: List[Dict], question: str) -> Optional[str]:
+        """The cached answer for question over these retrieval results, if any."""
+        chunks = chunk_key(results)
+        answer = self._get(user_id, chunks, question)
+        if answer is None and self.semantic and self._has_candidates(user_id, chunks):
+            vector = await self._embed(question)
+            answer = self._get_similar(user_id, chunks, vector)
+        if answer is None:
+            with self._lock:
+                self.misses += 1
+        return answer
+
+    async def store(self, user_id: str, results: List[Dict], question: str, answer: str):
+        if not answer.strip() or not self.max_items:
+            return
+        vector = await self._embed(question) if self.semantic else None
+        key = (user_id, chunk_key(results), normalize_question(question))
+        documents = {r["document_id"] for r in results}
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = _Entry(answer, vector, documents, time.monotonic() + self.ttl)
+            self._by_chunks.setdefault(key[:2], set()).add(key)
+            for document_id in documents:
+                self._by_document.setdefault((user_id, document_id), set()).add(key)
+            while len(self._entries) > self.max_items:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_documents(self, user_id: str, document_ids: Iterable):
+        with self._lock:
+            for document_id in document_ids:
+                for key in list(self._by_document.get((user_id, document_id), ())):
+                    self._drop(key)
+
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                self._drop(key)
+
+    async def _embed(self, question: str) -> np.ndarray:
+        vector = (await EmbeddingService().embed_texts_async([question]))[0]
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _get(self, user_id: str, chunks: Tuple[int, ...], question: str) -> Optional[str]:
+        key = (user_id, chunks, normalize_question(question))
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry.answer
+
+    def _has_candidates(self, user_id: str, chunks: Tuple[int, ...]) -> bool:
+        with self._lock:
+            return bool(self._by_chunks.get((user_id, chunks)))
+
+    def _get_similar(self, user_id: str, chunks: Tuple[int, ...], vector: np.ndarray) -> Optional[str]:
+        with self._lock:
+            best_key, best = None, self.similarity
+            for key in list(self._by_chunks.get((user_id, chunks), ())):
+                entry = self._live(key)
+                if entry is None or entry.vector is None:
+                    continue
+                similarity = float(np.dot(vector, entry.vector))
+                if similarity >= best:
+                    best_key, best = key, similarity
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self._entries[best_key].answer
+
+    def _live(self, key: CacheKey) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires <= time.monotonic():
+            self._drop(key)
+            return None
+        return entry
+
+    def _drop(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        siblings = self._by_chunks.get(key[:2])
+        if siblings is not None:
+            siblings.discard(key)
+            if not siblings:
+                del self._by_chunks[key[:2]]
+        for document_id in entry.documents:
+            keys = self._by_document.get((key[0], document_id))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_document[(key[0], document_id)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_items": self.max_items,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
+
+
+# Disabled, it keeps nothing, so every lookup misses without embedding anything
+response_cache = ResponseCache(max_items=RESPONSE_CACHE_MAX_ITEMS if RESPONSE_CACHE else 0)
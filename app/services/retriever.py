@@ -1,9 +1,11 @@
 from typing import List, Dict, Optional
-import numpy as np
-from pathlib import Path
 
 from app.services.embeddings import EmbeddingService
-from app.services.vector_store import FAISSVectorStore
+from app.services.executors import search_executor
+from app.services.response_cache import response_cache
+from app.services.study_cache import study_cache
+from app.services.vector_store import store_path_for
+from app.services.store_registry import store_registry
 
 
 class Retriever:
@@ -11,51 +13,72 @@ class Retriever:
         self.user_id = user_id
         self.embedding_service = EmbeddingService()
         self.top_k = top_k
-        self.store_path = Path(f"data/vector_store/{user_id}")
+        self.store_path = store_path_for(user_id)
         # DON'T load on init - load when needed
         self._vector_store = None
     
     @property
     def vector_store(self):
-        """Lazy load vector store only when needed"""
+        """Lazy lookup of the shared, already-warm store from the registry"""
         if self._vector_store is None:
-            self._vector_store = FAISSVectorStore(
-                dim=384,  # MiniLM embedding dimension
-                store_path=self.store_path
-            )
-            self._vector_store.load()
+            self._vector_store = store_registry.get(self.user_id)
         return self._vector_store
 
-    def retrieve(self, query: str, document_ids: Optional[List[int]] = None) -> List[Dict]:
-        """Retrieve relevant documents for this user, optionally filtered by document_ids"""
+    def retrieve(
+        self,
+        query: str,
+        document_ids: Optional[List[int]] = None,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+    ) -> List[Dict]:
+        """Retrieve relevant documents for this user, optionally filtered by document_ids.
+
+        ef_search / nprobe trade recall for speed once the user's store has been
+        promoted to an HNSW / IVF index; they are ignored for flat indexes.
+        """
         # Check if vector store is empty
-        if self.vector_store.index.ntotal == 0:
+        if self.vector_store.live_count() == 0:
             return []
         
         query_vector = self.embedding_service.embed_texts([query])
-        query_vector = query_vector.astype("float32")
+        return self._search(query_vector, document_ids, ef_search, nprobe)
 
-        # Get more results initially to filter later
-        search_k = self.top_k * 3 if document_ids else self.top_k
-        results = self.vector_store.search(query_vector, k=search_k)
-        
-        # Filter by document_ids if provided
-        if document_ids:
-            filtered_results = []
-            for result in results:
-                # Check if this result belongs to one of the selected documents
-                doc_id = result.get("document_id") or result.get("doc_id")
-                if doc_id in document_ids:
-                    filtered_results.append(result)
-                    # Stop when we have enough results
-                    if len(filtered_results) >= self.top_k:
-                        break
-            return filtered_results
-        
-        return results
+    async def aretrieve(
+        self,
+        query: str,
+        document_ids: Optional[List[int]] = None,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+    ) -> List[Dict]:
+        """retrieve() for async routes: the store lookup and the FAISS search run on
+        the search executor and the query is embedded off the event loop."""
+        if await search_executor.run(self._live_count) == 0:
+            return []
+
+        query_vector = await self.embedding_service.embed_texts_async([query])
+        return await search_executor.run(self._search, query_vector, document_ids, ef_search, nprobe)
+
+    def _live_count(self) -> int:
+        # Looking up the store may load it from disk
+        return self.vector_store.live_count()
+
+    def _search(self, query_vector, document_ids, ef_search, nprobe) -> List[Dict]:
+        # The filter is applied inside the index search, so this is exactly
+        # top_k hits from the selected documents whenever they have that many
+        return self.vector_store.search(
+            query_vector.astype("float32"),
+            k=self.top_k,
+            ef_search=ef_search,
+            nprobe=nprobe,
+            document_ids=document_ids,
+        )
     
     def delete_user_data(self):
         """Delete all vectorstore data for this user"""
         import shutil
         if self.store_path.exists():
-            shutil.rmtree(self.store_path)
\ No newline at end of file
+            shutil.rmtree(self.store_path)
+        store_registry.invalidate(self.user_id)
+        # A recreated store numbers its chunks from zero again
+        response_cache.invalidate_user(self.user_id)
+        study_cache.invalidate_user(self.user_id)
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Process-wide registry of loaded per-user vector stores.
+
+Loading a store means reading index.faiss and its chunk metadata, which
+dominates retrieval latency for large libraries. The registry keeps recently
+used stores warm in an LRU bounded by an approximate heap byte budget (mapped
+index pages live in the page cache and are not counted) and by a hard cap on
+the number of stores, each of which holds open file mappings, so the
+retriever, the indexer and the delete endpoint all share one instance per user.
+Entries are revalidated against the on-disk file signature on every lookup, so
+writes from another worker process are still picked up, and this process's
+cached answers about the documents they changed are dropped.
+"""
+from collections import OrderedDict
+import logging
+import os
+import threading
+
+from app.services.response_cache import response_cache
+from app.services.vector_store import FAISSVectorStore, EMBEDDING_DIM, store_path_for
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORE_CACHE_MB = int(os.getenv("VECTOR_STORE_CACHE_MB", "512"))
+VECTOR_STORE_CACHE_MAX_STORES = int(os.getenv("VECTOR_STORE_CACHE_MAX_STORES", "64"))
+# Memory-map indexes read-only so concurrent users share the page cache
+VECTOR_STORE_MMAP = os.getenv("VECTOR_STORE_MMAP", "1") == "1"
+
+
+class StoreRegistry:
+    def __init__(self, max_bytes: int, max_stores: int = VECTOR_STORE_CACHE_MAX_STORES):
+        self.max_bytes = max_bytes
+        self.max_stores = max_stores
+        self._stores: "OrderedDict[str, FAISSVectorStore]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str) -> FAISSVectorStore:
+        """Return the shared, up-to-date store for user_id, loading it if needed."""
+        with self._lock:
+            store = self._stores.get(user_id)
+            if store is None:
+                self.misses += 1
+                store = FAISSVectorStore(
+                    dim=EMBEDDING_DIM,
+                    store_path=store_path_for(user_id),
+                    mmap=VECTOR_STORE_MMAP,
+                )
+                self._stores[user_id] = store
+            else:
+                self.hits += 1
+            self._stores.move_to_end(user_id)
+
+        # Load outside the registry lock so one user's cold load doesn't block
+        # everyone else; concurrent callers for the same user wait on store.lock.
+        store.refresh()
+        # Documents an ingestion worker indexed or dropped: answers built from
+        # them in this process are stale
+        changed = store.pop_changed_documents()
+        if changed:
+            response_cache.invalidate_documents(user_id, changed)
+        self._evict(keep=user_id)
+        return store
+
+    def invalidate(self, user_id: str):
+        """Drop a user's store, e.g. after its files were removed from disk."""
+        with self._lock:
+            self._stores.pop(user_id, None)
+
+    def _evict(self, keep: str):
+        with self._lock:
+            total = sum(s.nbytes() for s in self._stores.values())
+            while (total > self.max_bytes or len(self._stores) > self.max_stores) and len(self._stores) > 1:
+                user_id, store = next(iter(self._stores.items()))
+                if user_id == keep:
+                    break
+                self._stores.pop(user_id)
+                total -= store.nbytes()
+                self.evictions += 1
+                logger.info(f"Evicted vector store for user {user_id} from cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "stores": len(self._stores),
+                "bytes": sum(s.nbytes() for s in self._stores.values()),
+                "max_bytes": self.max_bytes,
+                "max_stores": self.max_stores,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+store_registry = StoreRegistry(max_bytes=VECTOR_STORE_CACHE_MB * 1024 * 1024)
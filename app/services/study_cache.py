@@ -0,0 +1,109 @@
+"""
+Persistent cache of generated study artifacts (concepts, quizzes, flashcards).
+
+Artifacts live in a SQLite database on the data volume, so they survive
+restarts and are shared by every worker process. An artifact is keyed by the
+user, the document set, a fingerprint of the chunks those documents hold,
+the kind of artifact and its parameters. Deleting or re-indexing a document
+changes the fingerprint, so stale artifacts simply stop matching; rows of
+deleted documents are also dropped eagerly to keep the file small.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STUDY_CACHE_PATH = Path(os.getenv("STUDY_CACHE_PATH", "data/study_cache.sqlite3"))
+
+# Bump when prompts change so earlier artifacts are regenerated
+ARTIFACT_VERSION = 1
+
+
+def artifact_key(user_id: str, document_ids: List[str], fingerprint: str, kind: str, params: dict) -> str:
+    data = json.dumps(
+        [ARTIFACT_VERSION, user_id, sorted(document_ids), fingerprint, kind, params], sort_keys=True
+    )
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class StudyArtifactCache:
+    def __init__(self, path: Path = STUDY_CACHE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            # WAL lets other workers read while one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts ("
+                " key TEXT PRIMARY KEY, user_id TEXT NOT NULL, document_ids TEXT NOT NULL,"
+                " kind TEXT NOT NULL, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS artifacts_user ON artifacts (user_id)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM artifacts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, user_id: str, document_ids: List[str], kind: str, value: dict):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?)",
+                (key, user_id, json.dumps(sorted(document_ids)), kind, json.dumps(value), time.time()),
+            )
+            conn.commit()
+
+    def invalidate_documents(self, user_id: str, document_ids: Iterable):
+        document_ids = set(document_ids)
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT key, document_ids FROM artifacts WHERE user_id = ?", (user_id,)
+            ).fetchall()
+            stale = [(key,) for key, docs in rows if document_ids & set(json.loads(docs))]
+            conn.executemany("DELETE FROM artifacts WHERE key = ?", stale)
+            conn.commit()
+        if stale:
+            logger.info(f"Dropped {len(stale)} cached study artifacts for user {user_id}")
+
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM artifacts WHERE user_id = ?", (user_id,))
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._connect().execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "artifacts": rows,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+study_cache = StudyArtifactCache()
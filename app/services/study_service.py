@@ -1,36 +1,168 @@
-import os
+from collections import OrderedDict
+import asyncio
+import hashlib
 import json
 import logging
-from groq import Groq
-from pathlib import Path
-from typing import List
+import math
+import os
+import threading
+import time
+import numpy as np
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
 from datetime import date
 
-from app.services.vector_store import FAISSVectorStore
+from app.services.embedding_cache import normalize_text
+from app.services.executors import ExecutorSaturated, search_executor
+from app.services.json_stream import JsonArrayStreamer, parse_json_object
+from app.services.llm import GROQ_MODEL, get_groq_client
+from app.services.study_cache import artifact_key, study_cache
+from app.services.vector_store import store_path_for
+from app.services.store_registry import store_registry
 
 logger = logging.getLogger(__name__)
 
 MAX_CONTEXT_CHARS = 40_000
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+# Every study tool on a document set reads the same context; keep the last few
+STUDY_CONTEXT_CACHE_ITEMS = int(os.getenv("STUDY_CONTEXT_CACHE_ITEMS", "64"))
+
+# Material larger than the prompt budget is either "sample"d: one call over the
+# chunks nearest the k-means centroids of its embeddings, up to STUDY_SAMPLE_CHARS
+# (broad coverage, fewer tokens); or, for quizzes and flashcards, "map_reduce"d:
+# generated per context window in parallel (map) and merged (reduce). Every
+# window is mapped, each asked for only its share of the items, and
+# STUDY_MAP_CONCURRENCY bounds the in-flight LLM calls of one request.
+STUDY_LARGE_CONTEXT = os.getenv("STUDY_LARGE_CONTEXT", "sample")
+STUDY_SAMPLE_CHARS = int(os.getenv("STUDY_SAMPLE_CHARS", "24000"))
+STUDY_MAP_CONCURRENCY = int(os.getenv("STUDY_MAP_CONCURRENCY", "4"))
+# Each window is asked for this much more than its share, so duplicates
+# dropped in the reduce step still leave enough items
+MAP_OVERSHOOT = 1.5
+
+# Warm concepts and a starter flashcard deck for each newly indexed document
+STUDY_PREGENERATE = os.getenv("STUDY_PREGENERATE", "1") == "1"
+STARTER_DECK_CARDS = 15
+
+# A study pack runs up to STUDY_PACK_CONCURRENCY generators at once; one that
+# takes longer than STUDY_PACK_TIMEOUT seconds is reported as failed
+STUDY_PACK_CONCURRENCY = int(os.getenv("STUDY_PACK_CONCURRENCY", "3"))
+STUDY_PACK_TIMEOUT = float(os.getenv("STUDY_PACK_TIMEOUT", "90"))
+PACK_TOOLS = ("concepts", "flashcards", "quiz")
+
+_contexts: "OrderedDict[tuple, object]" = OrderedDict()
+_contexts_lock = threading.Lock()
+
+
+def _memoized(user_id: str, document_ids: List[str], kind: str, build: Callable):
+    """build(store), memoized per (user, documents, store generation). build takes
+    the store's lock itself, only for as long as it reads from the store."""
+    store = store_registry.get(user_id)
+    key = (user_id, tuple(sorted(document_ids)), store.generation, kind)
+    with _contexts_lock:
+        value = _contexts.get(key)
+        if value is not None:
+            _contexts.move_to_end(key)
+            return value
+    value = build(store)
+
+    with _contexts_lock:
+        _contexts[key] = value
+        while len(_contexts) > STUDY_CONTEXT_CACHE_ITEMS:
+            _contexts.popitem(last=False)
+    return value
 
 
 def _get_context(user_id: str, document_ids: List[str]) -> str:
-    store_path = Path(f"data/vector_store/{user_id}")
-    if not store_path.exists():
+    """The first MAX_CONTEXT_CHARS of the documents' text."""
+    if not store_path_for(user_id).exists():
         return ""
-    store = FAISSVectorStore(dim=384, store_path=store_path)
-    store.load()
-    chunks = store.get_by_document_ids(document_ids)
-    if not chunks:
+    return _memoized(user_id, document_ids, "context", lambda store: store.text_for_document_ids(
+        document_ids, MAX_CONTEXT_CHARS, CONTEXT_SEPARATOR))
+
+
+def _get_sampled_context(user_id: str, document_ids: List[str]) -> str:
+    """Representative chunks of the documents (all of them if they fit) within STUDY_SAMPLE_CHARS."""
+    if not store_path_for(user_id).exists():
         return ""
-    parts = [c.get("text", "") for c in chunks if c.get("text")]
-    context = "\n\n---\n\n".join(parts)
-    return context[:MAX_CONTEXT_CHARS]
+    return _memoized(user_id, document_ids, "sample", lambda store: store.sampled_text_for_document_ids(
+        document_ids, STUDY_SAMPLE_CHARS, CONTEXT_SEPARATOR))
+
+
+def _get_windows(user_id: str, document_ids: List[str]) -> List[str]:
+    """The documents' full text in windows of up to MAX_CONTEXT_CHARS."""
+    if not store_path_for(user_id).exists():
+        return []
+    return _memoized(user_id, document_ids, "windows", lambda store: store.text_windows_for_document_ids(
+        document_ids, MAX_CONTEXT_CHARS, CONTEXT_SEPARATOR))
+
+
+def _get_fingerprint(user_id: str, document_ids: List[str]) -> Optional[str]:
+    """Hash of the chunk ids the documents hold; changes whenever their content does."""
+    if not store_path_for(user_id).exists():
+        return None
+
+    def fingerprint(store) -> str:
+        with store.lock:
+            ids = store.chunks.ids_for_documents(document_ids)
+        return hashlib.blake2b(np.sort(ids).tobytes(), digest_size=16).hexdigest()
+
+    return _memoized(user_id, document_ids, "fingerprint", fingerprint)
+
+
+_inflight: Dict[str, "asyncio.Future"] = {}
+
+
+async def _cached_artifact(user_id: str, document_ids: List[str], kind: str, params: dict,
+                           generate: Callable[[], Awaitable[dict]], refresh: bool = False) -> dict:
+    """generate(), served from the artifact cache while the documents are unchanged.
+
+    Concurrent requests for the same artifact (e.g. a click during background
+    pre-generation) share one generation.
+    """
+    fingerprint = await search_executor.run(_get_fingerprint, user_id, document_ids)
+    if fingerprint is None:
+        return await generate()
+    key = artifact_key(user_id, document_ids, fingerprint, kind, {**params, "context": STUDY_LARGE_CONTEXT})
+    if not refresh:
+        cached = await asyncio.to_thread(study_cache.get, key)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+    task = _inflight.get(key)
+    if task is None:
+        async def produce() -> dict:
+            result = await generate()
+            await asyncio.to_thread(study_cache.put, key, user_id, document_ids, kind, result)
+            return result
+
+        task = asyncio.ensure_future(produce())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # A client that goes away must not cancel a generation others may be waiting on
+    return await asyncio.shield(task)
+
+
+async def pregenerate(user_id: str, document_ids: List[str]):
+    """Fill the artifact cache with concepts and a starter deck for the documents."""
+    started = time.perf_counter()
+    for kind, generate in (
+        ("concepts", lambda: extract_key_concepts(user_id, document_ids)),
+        ("flashcards", lambda: generate_flashcards(user_id, document_ids, STARTER_DECK_CARDS)),
+    ):
+        try:
+            await generate()
+        except Exception as e:
+            logger.warning(f"Pre-generating {kind} for user {user_id} failed: {e}")
+    logger.info(f"Pre-generated study artifacts for {document_ids} in {_ms(started)} ms")
+
 
+def _ms(since: float) -> int:
+    return round(1000 * (time.perf_counter() - since))
 
-def _groq_json(system: str, prompt: str) -> dict:
-    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-    response = client.chat.completions.create(
-        model="openai/gpt-oss-120b",
+
+async def _groq_json(system: str, prompt: str) -> dict:
+    response = await get_groq_client().chat.completions.create(
+        model=GROQ_MODEL,
         messages=[
             {"role": "system", "content": system},
             {"role": "user", "content": prompt},
@@ -42,11 +174,95 @@ def _groq_json(system: str, prompt: str) -> dict:
     return json.loads(response.choices[0].message.content)
 
 
-def generate_quiz(user_id: str, document_ids: List[str], num_questions: int = 10, question_type: str = "mixed") -> dict:
-    context = _get_context(user_id, document_ids)
-    if not context:
+async def _generate_items(user_id: str, document_ids: List[str], system: str,
+                          build_prompt: Callable[[str, int], str], field: str, count: int,
+                          item_key: Callable[[dict], str]) -> dict:
+    """Generate count items into result[field] from a sampled context, or map-reduced
+    over windows when the documents don't fit one. Stage latencies are reported under "timings"."""
+    started = time.perf_counter()
+    if STUDY_LARGE_CONTEXT == "sample":
+        context = await search_executor.run(_get_sampled_context, user_id, document_ids)
+        windows = [context] if context else []
+    else:
+        windows = await search_executor.run(_get_windows, user_id, document_ids)
+    if not windows:
         raise ValueError("No content found for the selected documents.")
+    timings = {"windows": len(windows), "context_ms": _ms(started)}
+
+    if len(windows) == 1:
+        started = time.perf_counter()
+        result = await _groq_json(system, build_prompt(windows[0], count))
+        if field not in result:
+            raise ValueError("Unexpected response format from AI.")
+        timings["generate_ms"] = _ms(started)
+        return {**result, "timings": timings}
+
+    # Map: one call per window, each asked for its share of the items (at least one)
+    started = time.perf_counter()
+    per_window = math.ceil(count * MAP_OVERSHOOT / len(windows))
+    semaphore = asyncio.Semaphore(STUDY_MAP_CONCURRENCY)
+
+    async def generate(window: str) -> dict:
+        async with semaphore:
+            return await _groq_json(system, build_prompt(window, per_window))
+
+    mapped = await asyncio.gather(*(generate(w) for w in windows), return_exceptions=True)
+    results = [r for r in mapped if isinstance(r, dict) and isinstance(r.get(field), list)]
+    if not results:
+        failure = next((r for r in mapped if isinstance(r, Exception)), None)
+        if failure is not None:
+            raise failure
+        raise ValueError("Unexpected response format from AI.")
+    if len(results) < len(windows):
+        logger.warning(f"Study generation: {len(windows) - len(results)} of {len(windows)} windows failed")
+    timings["map_ms"] = _ms(started)
+
+    # Reduce: take the windows' items round by round, dropping near-verbatim
+    # duplicates; a round that no longer fits whole is thinned evenly across
+    # the windows, so the end of the material is represented as well as its start
+    started = time.perf_counter()
+    items, seen = [], set()
+    queues = [list(r[field]) for r in results]
+    while len(items) < count and any(queues):
+        round_items = []
+        for queue in queues:
+            if queue:
+                item = queue.pop(0)
+                key = item_key(item) if isinstance(item, dict) else ""
+                if key and key not in seen:
+                    seen.add(key)
+                    round_items.append(item)
+        need = count - len(items)
+        if len(round_items) > need:
+            picks = np.linspace(0, len(round_items) - 1, need).round().astype(int)
+            round_items = [round_items[i] for i in picks]
+        for item in round_items:
+            items.append({**item, "id": len(items) + 1})
+    timings["reduce_ms"] = _ms(started)
+
+    logger.info(f"Study generation for user {user_id}: {len(items)} {field} from {len(windows)} windows, {timings}")
+    return {**results[0], field: items, "timings": timings}
+
+
+def _item_key(field: str) -> Callable[[dict], str]:
+    return lambda item: normalize_text(str(item.get(field, ""))).lower()
+
+
+async def generate_quiz(user_id: str, document_ids: List[str], num_questions: int = 10, question_type: str = "mixed",
+                        refresh: bool = False) -> dict:
+    return await _cached_artifact(
+        user_id, document_ids, "quiz", {"num_questions": num_questions, "question_type": question_type},
+        lambda: _generate_quiz(user_id, document_ids, num_questions, question_type), refresh,
+    )
+
 
+async def _generate_quiz(user_id: str, document_ids: List[str], num_questions: int, question_type: str) -> dict:
+    system, prompt = _quiz_prompt(question_type)
+    return await _generate_items(user_id, document_ids, system, prompt, "questions",
+                                 num_questions, _item_key("question"))
+
+
+def _quiz_prompt(question_type: str) -> Tuple[str, Callable[[str, int], str]]:
     type_instruction = {
         "mcq":          "All questions must be multiple choice (4 options each).",
         "true_false":   "All questions must be True/False.",
@@ -56,7 +272,8 @@ def generate_quiz(user_id: str, document_ids: List[str], num_questions: int = 10
 
     system = "You are an expert educator. Generate quiz questions from study material. Return only valid JSON."
 
-    prompt = f"""Generate exactly {num_questions} quiz questions from the study material below.
+    def prompt(context: str, count: int) -> str:
+        return f"""Generate exactly {count} quiz questions from the study material below.
 {type_instruction}
 
 Study Material:
@@ -92,20 +309,28 @@ Return JSON exactly like this:
   ]
 }}"""
 
-    result = _groq_json(system, prompt)
-    if "questions" not in result:
-        raise ValueError("Unexpected response format from AI.")
-    return result
+    return system, prompt
 
 
-def generate_flashcards(user_id: str, document_ids: List[str], num_cards: int = 15) -> dict:
-    context = _get_context(user_id, document_ids)
-    if not context:
-        raise ValueError("No content found for the selected documents.")
+async def generate_flashcards(user_id: str, document_ids: List[str], num_cards: int = 15,
+                              refresh: bool = False) -> dict:
+    return await _cached_artifact(
+        user_id, document_ids, "flashcards", {"num_cards": num_cards},
+        lambda: _generate_flashcards(user_id, document_ids, num_cards), refresh,
+    )
+
+
+async def _generate_flashcards(user_id: str, document_ids: List[str], num_cards: int) -> dict:
+    system, prompt = _flashcard_prompt()
+    return await _generate_items(user_id, document_ids, system, prompt, "flashcards",
+                                 num_cards, _item_key("front"))
+
 
+def _flashcard_prompt() -> Tuple[str, Callable[[str, int], str]]:
     system = "You are an expert educator. Create flashcards from study material. Return only valid JSON."
 
-    prompt = f"""Create exactly {num_cards} flashcards from the study material below.
+    def prompt(context: str, count: int) -> str:
+        return f"""Create exactly {count} flashcards from the study material below.
 Focus on key terms, definitions, concepts, processes, and important facts.
 
 Study Material:
@@ -126,14 +351,18 @@ Return JSON exactly like this:
 
 Category must be one of: Definition, Concept, Formula, Process, Fact, Example"""
 
-    result = _groq_json(system, prompt)
-    if "flashcards" not in result:
-        raise ValueError("Unexpected response format from AI.")
-    return result
+    return system, prompt
+
+
+async def extract_key_concepts(user_id: str, document_ids: List[str], refresh: bool = False) -> dict:
+    return await _cached_artifact(
+        user_id, document_ids, "concepts", {},
+        lambda: _extract_key_concepts(user_id, document_ids), refresh,
+    )
 
 
-def extract_key_concepts(user_id: str, document_ids: List[str]) -> dict:
-    context = _get_context(user_id, document_ids)
+async def _extract_key_concepts(user_id: str, document_ids: List[str]) -> dict:
+    context = await search_executor.run(_get_sampled_context, user_id, document_ids)
     if not context:
         raise ValueError("No content found for the selected documents.")
 
@@ -157,17 +386,25 @@ Return JSON exactly like this:
 
 Generate 8-12 key terms, 4-6 main topics, and 5-8 likely exam questions."""
 
-    result = _groq_json(system, prompt)
+    result = await _groq_json(system, prompt)
     if "key_terms" not in result:
         raise ValueError("Unexpected response format from AI.")
     return result
 
 
-def generate_study_plan(user_id: str, document_ids: List[str], exam_date: str, hours_per_day: float = 2.0) -> dict:
-    context = _get_context(user_id, document_ids)
+async def generate_study_plan(user_id: str, document_ids: List[str], exam_date: str, hours_per_day: float = 2.0) -> dict:
+    context = await search_executor.run(_get_context, user_id, document_ids)
     if not context:
         raise ValueError("No content found for the selected documents.")
 
+    system, prompt = _plan_prompt(exam_date, hours_per_day)
+    result = await _groq_json(system, prompt(context))
+    if "plan" not in result:
+        raise ValueError("Unexpected response format from AI.")
+    return result
+
+
+def _plan_prompt(exam_date: str, hours_per_day: float) -> Tuple[str, Callable[[str], str]]:
     today = date.today()
     try:
         exam_dt = date.fromisoformat(exam_date)
@@ -177,7 +414,8 @@ def generate_study_plan(user_id: str, document_ids: List[str], exam_date: str, h
 
     system = "You are an expert study coach. Create personalised study plans. Return only valid JSON."
 
-    prompt = f"""Create a {days_available}-day study plan. The student has {hours_per_day} hours per day. Exam date: {exam_date}.
+    def prompt(context: str) -> str:
+        return f"""Create a {days_available}-day study plan. The student has {hours_per_day} hours per day. Exam date: {exam_date}.
 
 Study Material:
 {context}
@@ -201,14 +439,11 @@ Return JSON exactly like this:
 
 Cover ALL {days_available} days. Progress from foundations to advanced. Reserve the last 1-2 days for review."""
 
-    result = _groq_json(system, prompt)
-    if "plan" not in result:
-        raise ValueError("Unexpected response format from AI.")
-    return result
+    return system, prompt
 
 
-def generate_active_recall_question(user_id: str, document_ids: List[str], previous_questions: List[str] = None) -> dict:
-    context = _get_context(user_id, document_ids)
+async def generate_active_recall_question(user_id: str, document_ids: List[str], previous_questions: List[str] = None) -> dict:
+    context = await search_executor.run(_get_context, user_id, document_ids)
     if not context:
         raise ValueError("No content found for the selected documents.")
 
@@ -232,10 +467,10 @@ Return JSON exactly like this:
   "model_answer": "A complete model answer covering key points."
 }}"""
 
-    return _groq_json(system, prompt)
+    return await _groq_json(system, prompt)
 
 
-def evaluate_recall_answer(question: str, student_answer: str, model_answer: str) -> dict:
+async def evaluate_recall_answer(question: str, student_answer: str, model_answer: str) -> dict:
     system = "You are a supportive tutor evaluating a student's answer. Return only valid JSON."
 
     prompt = f"""Evaluate this student's answer.
@@ -255,4 +490,188 @@ Return JSON exactly like this:
 
 Score 1-5: 1=completely wrong, 3=partially correct, 5=fully correct."""
 
-    return _groq_json(system, prompt)
+    return await _groq_json(system, prompt)
+
+
+# --- Streaming variants: each item is emitted as soon as the LLM has written it ---
+
+async def _groq_json_stream(system: str, prompt: str) -> AsyncGenerator[str, None]:
+    # No response_format: JSON mode only checks the answer once it is complete,
+    # so the prompt alone asks for JSON and the text is parsed as it arrives
+    stream = await get_groq_client().chat.completions.create(
+        model=GROQ_MODEL,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.4,
+        stream=True,
+        timeout=60,
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def _stream_items(system: str, prompt: str, field: str) -> AsyncGenerator[dict, None]:
+    """{"type": "item"} events for the elements of result[field] as they complete,
+    then {"type": "done"} with the whole parsed result."""
+    streamer = JsonArrayStreamer(field)
+    parts = []
+    async for text in _groq_json_stream(system, prompt):
+        parts.append(text)
+        for item in streamer.feed(text):
+            yield {"type": "item", "item": item}
+    try:
+        result = parse_json_object("".join(parts))
+    except json.JSONDecodeError:
+        raise ValueError("Unexpected response format from AI.")
+    if not isinstance(result, dict) or field not in result:
+        raise ValueError("Unexpected response format from AI.")
+    yield {"type": "done", "result": result}
+
+
+async def _replay(result: dict, field: str) -> AsyncGenerator[dict, None]:
+    for item in result.get(field, []):
+        yield {"type": "item", "item": item}
+    yield {"type": "done", "result": result}
+
+
+async def _stream_artifact(user_id: str, document_ids: List[str], kind: str, params: dict,
+                           system: str, build_prompt: Callable[[str, int], str], field: str, count: int,
+                           generate: Callable[[], Awaitable[dict]], refresh: bool = False
+                           ) -> AsyncGenerator[dict, None]:
+    """Stream a cacheable artifact item by item. Cache hits, generations already
+    in flight and map-reduced material (whose items only exist once every window
+    is done) are replayed from the finished result."""
+    started = time.perf_counter()
+    fingerprint = await search_executor.run(_get_fingerprint, user_id, document_ids)
+    key = None
+    if fingerprint is not None:
+        key = artifact_key(user_id, document_ids, fingerprint, kind, {**params, "context": STUDY_LARGE_CONTEXT})
+        cached = None if refresh else await asyncio.to_thread(study_cache.get, key)
+        if cached is None and key in _inflight:
+            cached = await asyncio.shield(_inflight[key])
+        if cached is not None:
+            async for event in _replay({**cached, "cached": True}, field):
+                yield event
+            return
+
+    if STUDY_LARGE_CONTEXT == "sample":
+        context = await search_executor.run(_get_sampled_context, user_id, document_ids)
+    else:
+        windows = await search_executor.run(_get_windows, user_id, document_ids)
+        if len(windows) > 1:
+            # The cache was consulted above; refresh=True skips a second lookup
+            async for event in _replay(await _cached_artifact(
+                    user_id, document_ids, kind, params, generate, refresh=True), field):
+                yield event
+            return
+        context = windows[0] if windows else ""
+    if not context:
+        raise ValueError("No content found for the selected documents.")
+    timings = {"windows": 1, "context_ms": _ms(started)}
+
+    started = time.perf_counter()
+    async for event in _stream_items(system, build_prompt(context, count), field):
+        if event["type"] == "item":
+            timings.setdefault("first_item_ms", _ms(started))
+            yield event
+            continue
+        timings["generate_ms"] = _ms(started)
+        result = {**event["result"], "timings": timings}
+        if key is not None:
+            await asyncio.to_thread(study_cache.put, key, user_id, document_ids, kind, result)
+        yield {"type": "done", "result": result}
+
+
+def stream_quiz(user_id: str, document_ids: List[str], num_questions: int = 10, question_type: str = "mixed",
+                refresh: bool = False) -> AsyncGenerator[dict, None]:
+    system, prompt = _quiz_prompt(question_type)
+    return _stream_artifact(
+        user_id, document_ids, "quiz", {"num_questions": num_questions, "question_type": question_type},
+        system, prompt, "questions", num_questions,
+        lambda: _generate_quiz(user_id, document_ids, num_questions, question_type), refresh,
+    )
+
+
+def stream_flashcards(user_id: str, document_ids: List[str], num_cards: int = 15,
+                      refresh: bool = False) -> AsyncGenerator[dict, None]:
+    system, prompt = _flashcard_prompt()
+    return _stream_artifact(
+        user_id, document_ids, "flashcards", {"num_cards": num_cards},
+        system, prompt, "flashcards", num_cards,
+        lambda: _generate_flashcards(user_id, document_ids, num_cards), refresh,
+    )
+
+
+async def stream_study_plan(user_id: str, document_ids: List[str], exam_date: str,
+                            hours_per_day: float = 2.0) -> AsyncGenerator[dict, None]:
+    context = await search_executor.run(_get_context, user_id, document_ids)
+    if not context:
+        raise ValueError("No content found for the selected documents.")
+
+    system, prompt = _plan_prompt(exam_date, hours_per_day)
+    async for event in _stream_items(system, prompt(context), "plan"):
+        yield event
+
+
+# --- Study pack: several generators over one document set, run concurrently ---
+
+def _warm_pack_context(user_id: str, document_ids: List[str]) -> bool:
+    """Build the memoized context the pack's generators read; False if there is no content."""
+    if _get_fingerprint(user_id, document_ids) is None:
+        return False
+    if STUDY_LARGE_CONTEXT == "sample":
+        return bool(_get_sampled_context(user_id, document_ids))
+    # Concepts always read the sample, quizzes and flashcards the windows
+    return bool(_get_sampled_context(user_id, document_ids)) and bool(_get_windows(user_id, document_ids))
+
+
+async def generate_pack(user_id: str, document_ids: List[str], tools: List[str], num_cards: int = 15,
+                        num_questions: int = 10, question_type: str = "mixed",
+                        refresh: bool = False) -> AsyncGenerator[dict, None]:
+    """{"type": "result"} or {"type": "error"} per tool, in the order they finish,
+    then {"type": "done"} listing what completed and what failed."""
+    unknown = [t for t in tools if t not in PACK_TOOLS]
+    if unknown or not tools:
+        raise ValueError(f"Unknown study tools: {unknown}" if unknown else "No study tools requested.")
+    if not await search_executor.run(_warm_pack_context, user_id, document_ids):
+        raise ValueError("No content found for the selected documents.")
+
+    generators = {
+        "concepts": lambda: extract_key_concepts(user_id, document_ids, refresh),
+        "flashcards": lambda: generate_flashcards(user_id, document_ids, num_cards, refresh),
+        "quiz": lambda: generate_quiz(user_id, document_ids, num_questions, question_type, refresh),
+    }
+    semaphore = asyncio.Semaphore(STUDY_PACK_CONCURRENCY)
+
+    async def run(tool: str) -> dict:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                # Cached generations are shielded, so a timed-out one still
+                # finishes into the artifact cache for the next request
+                result = await asyncio.wait_for(generators[tool](), STUDY_PACK_TIMEOUT)
+            except asyncio.TimeoutError:
+                return {"type": "error", "tool": tool, "detail": f"Timed out after {STUDY_PACK_TIMEOUT:g}s."}
+            except (ValueError, ExecutorSaturated) as e:
+                return {"type": "error", "tool": tool, "detail": str(e)}
+            except Exception as e:
+                logger.error(f"Study pack {tool} failed for user {user_id}: {e}", exc_info=True)
+                return {"type": "error", "tool": tool, "detail": "Generation failed. Please try again."}
+            return {"type": "result", "tool": tool, "result": result, "ms": _ms(started)}
+
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(run(tool)) for tool in dict.fromkeys(tools)]
+    completed, failed = [], []
+    try:
+        for finished in asyncio.as_completed(tasks):
+            event = await finished
+            (completed if event["type"] == "result" else failed).append(event["tool"])
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+    logger.info(f"Study pack for user {user_id}: {completed} done, {failed} failed in {_ms(started)} ms")
+    yield {"type": "done", "completed": completed, "failed": failed, "ms": _ms(started)}
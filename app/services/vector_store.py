@@ -1,81 +1,664 @@
 import faiss
+import fcntl
+import itertools
+import json
+import os
 import pickle
+import threading
+import logging
 import numpy as np
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, NamedTuple, Optional, Set, Tuple
+
+from app.services.chunk_store import ChunkStore
+from app.services.faiss_index import (
+    VECTOR_FILTER_EXACT_MAX, IndexSpec, build_index, empty_index, exact_search,
+    export_vectors, id_map_bytes, index_spec, kmeans_medoids, read_index, search_params, target_spec, vector_bytes,
+)
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORE_DIR = Path("data/vector_store")
+EMBEDDING_DIM = 384  # MiniLM embedding dimension
+# Merge a store's segments in the background once it has this many on disk
+VECTOR_SEGMENT_MERGE_AT = int(os.getenv("VECTOR_SEGMENT_MERGE_AT", "8"))
+
+
+# Store generations are drawn from one process-wide counter, so a generation
+# also tells apart two instances of the same store (e.g. after an eviction)
+_generations = itertools.count(1)
+
+
+def store_path_for(user_id: str) -> Path:
+    return VECTOR_STORE_DIR / user_id
+
+
+class Segment(NamedTuple):
+    """An id-mapped flat index holding chunk ids from first_id up to the next segment's.
+
+    file is None until the segment has been written by save().
+    """
+    file: Optional[str]
+    first_id: int
+    index: faiss.Index
 
 
 class FAISSVectorStore:
-    def __init__(self, dim: int, store_path: Path):
+    """A user's chunks and their vectors, persisted as a base index plus segments.
+
+    Each save() writes newly added vectors as a small flat segment file, so
+    indexing a document costs I/O for that document only. Searches fan out
+    over the base index and every segment. A background merge folds segments
+    together, or into the base index (promoting / compressing it when the
+    settings call for it), and drops tombstoned vectors along the way.
+
+    Everything a store consists of is named by manifest.json, which is
+    replaced atomically and versioned: files are only ever appended to past
+    their committed length or written under new names, so a crash at any
+    point leaves the previous manifest and everything it names intact.
+    Writers from any thread or worker process serialize on a per-store file
+    lock via transaction().
+    """
+    MANIFEST_FILE = "manifest.json"
+    SEGMENT_DIR = "segments"
+    LOCK_FILE = "write.lock"
+    # Written by versions before manifest.json existed
+    INDEX_FILE = "index.faiss"
+    LEGACY_META_FILE = "metadata.pkl"
+
+    # Rebuild once this fraction of the stored vectors are tombstoned
+    TOMBSTONE_REBUILD_RATIO = 0.1
+    # Segments are merged among themselves until they reach this fraction of
+    # the base index, and folded into it after that
+    SEGMENT_FOLD_RATIO = 0.1
+
+    def __init__(self, dim: int, store_path: Path, mmap: bool = False):
         self.dim = dim
-        self.index = faiss.IndexFlatL2(dim)
         self.store_path = store_path
-        self.metadata: List[Dict] = []
+        # Base index; vectors are keyed by the chunk ids the chunk store hands out
+        self.index = empty_index(dim)
+        self.base_file: Optional[str] = None
+        # Newer vectors, oldest first; base ids all precede segments[0].first_id
+        self.segments: List[Segment] = []
+        self.manifest_version = 0
+        self.chunks = ChunkStore(store_path)
+        # Deleted ids still present in the base index or a saved segment;
+        # excluded at search time until a merge drops them.
+        self.tombstones = np.empty(0, dtype=np.int64)
+        # Retrieval-only mode: index files are memory-mapped read-only, so the
+        # vectors live in the shared page cache instead of this process's heap.
+        # New vectors go to an in-memory segment that is mapped once saved.
+        self.mmap = mmap
+        self.read_only = False  # the base index is a read-only mapping
+        # Renewed on every in-memory mutation so caches layered on top of the
+        # store can tell when their view is out of date.
+        self.generation = next(_generations)
+        # Documents other processes added or removed since the last
+        # pop_changed_documents(); see _load()
+        self._changed_documents: Set[str] = set()
+        # (mtime_ns, size) of the files this instance was loaded from / saved to.
+        # None means the instance has never been synced with disk.
+        self.disk_signature: Optional[Tuple] = None
+        self.lock = threading.RLock()
+        self._committed_files = set()  # files the manifest on disk refers to
+        self._tombstone_file: Optional[str] = None
+        self._tombstones_dirty = False
+        self._lock_fd: Optional[int] = None
+        self._lock_depth = 0
+        self._base_dirty = False
+        self._unsaved = False
+        self._merging = False
 
     def add(self, vectors, metadatas: List[Dict]):
-        self.index.add(vectors)
-        self.metadata.extend(metadatas)
+        if not metadatas:
+            return
+        with self.lock:
+            self._sync()
+            ids = self.chunks.append(metadatas)
+            if not self.segments or self.segments[-1].file is not None:
+                self.segments.append(Segment(None, int(ids[0]), empty_index(self.dim)))
+            self.segments[-1].index.add_with_ids(vectors, ids)
+            self._unsaved = True
+            self.generation = next(_generations)
+
+    def _indexes(self) -> List:
+        return [self.index] + [s.index for s in self.segments]
+
+    def ntotal(self) -> int:
+        return sum(index.ntotal for index in self._indexes())
 
-    def search(self, query_vector, k: int = 5):
-        if self.index.ntotal == 0:
-            return []
+    def live_count(self) -> int:
+        return self.ntotal() - len(self.tombstones)
 
-        k = min(k, self.index.ntotal)
-        distances, indices = self.index.search(query_vector, k)
-        results = []
+    def search(
+        self,
+        query_vector,
+        k: int = 5,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        document_ids: Optional[List] = None,
+    ):
+        """Top-k chunks for query_vector, restricted to document_ids when given."""
+        with self.lock:
+            if self.live_count() == 0:
+                return []
 
-        for idx in indices[0]:
-            if idx == -1 or idx >= len(self.metadata):
+            if document_ids:
+                ids = np.setdiff1d(self.chunks.ids_for_documents(document_ids), self.tombstones)
+                if len(ids) == 0:
+                    return []
+                k = min(k, len(ids))
+                found = np.empty(0, dtype=np.int64)
+                if len(ids) > VECTOR_FILTER_EXACT_MAX:
+                    found = self._fan_out(query_vector, k, ef_search, nprobe, faiss.IDSelectorBatch(ids))
+                if len(found) < k:
+                    # Small sets are cheaper to score directly, and a selective
+                    # filter can starve HNSW / IVF probing of candidates
+                    found = exact_search(query_vector, self._reconstruct(ids), ids, k)
+            else:
+                k = min(k, self.live_count())
+                sel = batch = None
+                if len(self.tombstones):
+                    # The wrapper doesn't own batch; keep it referenced until search returns
+                    batch = faiss.IDSelectorBatch(self.tombstones)
+                    sel = faiss.IDSelectorNot(batch)
+                found = self._fan_out(query_vector, k, ef_search, nprobe, sel)
+
+            return [self.chunks.get(row) for row in self.chunks.rows_for_ids(found)]
+
+    def _fan_out(self, query_vector, k, ef_search, nprobe, sel) -> np.ndarray:
+        """Search the base index and every segment and merge their top-k by distance."""
+        distances, ids = [], []
+        for index in self._indexes():
+            if index.ntotal == 0:
                 continue
-            results.append(self.metadata[idx])
+            params = search_params(index, ef_search, nprobe, sel=sel)
+            d, i = index.search(query_vector, min(k, index.ntotal), params=params)
+            distances.append(d[0])
+            ids.append(i[0])
+        distances, ids = np.concatenate(distances), np.concatenate(ids)
+        found = ids != -1
+        order = np.argsort(distances[found], kind="stable")[:k]
+        return ids[found][order]
 
-        return results
+    def _reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        """Stored vectors for ids, read in one batch from each index that holds some of them."""
+        ids = np.asarray(ids, dtype=np.int64)
+        owners = np.searchsorted([s.first_id for s in self.segments], ids, side="right")
+        vectors = np.empty((len(ids), self.dim), dtype=np.float32)
+        for owner, index in enumerate(self._indexes()):
+            held = owners == owner
+            if held.any():
+                vectors[held] = index.reconstruct_batch(ids[held])
+        return vectors
 
-    def delete_by_document_id(self, document_id):
-        """Remove all vectors belonging to document_id and rebuild the index."""
-        keep_indices = [
-            i for i, m in enumerate(self.metadata)
-            if m.get("document_id") != document_id
-        ]
+    def export_live(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, vectors) of every chunk that hasn't been deleted."""
+        return self._export(self._indexes())
 
-        if len(keep_indices) == self.index.ntotal:
-            return  # nothing matched, nothing to do
+    def _export(self, indexes) -> Tuple[np.ndarray, np.ndarray]:
+        parts = [export_vectors(index) for index in indexes if index.ntotal]
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32)
+        ids = np.concatenate([p[0] for p in parts])
+        vectors = np.vstack([p[1] for p in parts])
+        live = ~np.isin(ids, self.tombstones)
+        return ids[live], vectors[live]
 
-        if not keep_indices:
-            self.index = faiss.IndexFlatL2(self.dim)
-            self.metadata = []
-            return
+    def delete_by_document_id(self, document_id):
+        """Remove all vectors belonging to document_id by chunk id."""
+        with self.lock:
+            if len(self.chunks.rows_for_documents([document_id])) == 0:
+                return  # nothing matched, nothing to do
 
-        # Reconstruct index from kept vectors
-        kept_vectors = np.vstack([
-            self.index.reconstruct(i) for i in keep_indices
-        ]).astype("float32")
+            self._sync()
+            ids = self.chunks.delete_document(document_id)
+            if len(ids) == 0:
+                return
+            self._unsaved = True
+            self.generation = next(_generations)
 
-        new_index = faiss.IndexFlatL2(self.dim)
-        new_index.add(kept_vectors)
-        self.index = new_index
-        self.metadata = [self.metadata[i] for i in keep_indices]
+            if self.chunks.live_count() == 0:
+                self.index = empty_index(self.dim)
+                self.segments = []
+                self.tombstones = np.empty(0, dtype=np.int64)
+                self._tombstones_dirty = True
+                self.chunks.clear(keep_next_id=True)
+                self.read_only = False
+                self._base_dirty = True
+                return
+
+            # Vectors not written yet are dropped outright; saved ones are
+            # tombstoned so the delete doesn't rewrite any index file
+            pending = self.segments[-1] if self.segments and self.segments[-1].file is None else None
+            if pending is not None:
+                pending.index.remove_ids(faiss.IDSelectorBatch(ids[ids >= pending.first_id]))
+                ids = ids[ids < pending.first_id]
+            self.tombstones = np.union1d(self.tombstones, ids)
+            self._tombstones_dirty = True
 
     def get_by_document_ids(self, document_ids: List[str]) -> List[Dict]:
         """Return all chunks for the given document IDs, ordered by page."""
-        id_set = set(document_ids)
-        results = [m for m in self.metadata if m.get("document_id") in id_set]
-        results.sort(key=lambda x: (x.get("document_id", ""), x.get("page", 0)))
-        return results
+        with self.lock:
+            rows = self.chunks.sorted_rows(self.chunks.rows_for_documents(document_ids))
+            return [self.chunks.get(row) for row in rows]
+
+    def text_for_document_ids(self, document_ids: List[str], max_chars: int, separator: str = "\n\n") -> str:
+        """Texts of the given documents' chunks, in get_by_document_ids order, joined
+        and cut at max_chars. Chunks past max_chars are never read."""
+        parts, size = [], 0
+        with self.lock:
+            rows = self.chunks.sorted_rows(self.chunks.rows_for_documents(document_ids))
+            for row in rows:
+                if size >= max_chars:
+                    break
+                text = self.chunks.text(row)
+                if text:
+                    parts.append(text)
+                    size += len(text) + len(separator)
+        return separator.join(parts)[:max_chars]
+
+    def text_windows_for_document_ids(self, document_ids: List[str], window_chars: int,
+                                      separator: str = "\n\n") -> List[str]:
+        """All chunk texts of the given documents, in get_by_document_ids order, packed
+        into consecutive windows of at most window_chars (longer chunks are cut)."""
+        windows, parts, size = [], [], 0
+        with self.lock:
+            rows = self.chunks.sorted_rows(self.chunks.rows_for_documents(document_ids))
+            for row in rows:
+                text = self.chunks.text(row)[:window_chars]
+                if not text:
+                    continue
+                if parts and size + len(separator) + len(text) > window_chars:
+                    windows.append(separator.join(parts))
+                    parts, size = [], 0
+                size += len(text) + (len(separator) if parts else 0)
+                parts.append(text)
+        if parts:
+            windows.append(separator.join(parts))
+        return windows
+
+    def sampled_text_for_document_ids(self, document_ids: List[str], max_chars: int,
+                                      separator: str = "\n\n") -> str:
+        """Representative chunk texts of the given documents within max_chars.
+
+        The chunks' vectors are clustered with k-means and the chunk nearest each
+        centroid is picked, largest cluster first, until max_chars is spent; picks
+        are joined in get_by_document_ids order. Documents that fit are returned whole.
+        Only copying the vectors holds the lock; the clustering runs without it.
+        """
+        with self.lock:
+            rows = self.chunks.rows_for_documents(document_ids)
+            lengths = np.asarray(self.chunks.columns["text_length"][rows], dtype=np.int64)
+            rows, lengths = rows[lengths > 0], lengths[lengths > 0] + len(separator)
+            if lengths.sum() <= max_chars:
+                return self.text_for_document_ids(document_ids, max_chars, separator)
+            ids = np.asarray(self.chunks.columns["id"][rows], dtype=np.int64)
+            vectors = self._reconstruct(ids)
+
+        # Lengths are UTF-8 bytes, so the budget is never overshot
+        k = int(max_chars // lengths.mean())
+        picked, size = [], 0
+        for position in kmeans_medoids(vectors, k):
+            if not picked or size + lengths[position] <= max_chars:
+                picked.append(ids[position])
+                size += lengths[position]
+
+        # Rows may have moved meanwhile; find the picks again by chunk id
+        with self.lock:
+            picked = np.asarray(picked, dtype=np.int64)
+            picked = picked[np.isin(picked, self.chunks.ids_for_documents(document_ids))]
+            rows = self.chunks.sorted_rows(self.chunks.rows_for_ids(np.sort(picked)))
+            return separator.join(self.chunks.text(row) for row in rows)[:max_chars]
+
+    def _maybe_merge(self):
+        if self._merging:
+            return
+        ntotal = self.ntotal()
+        spec = target_spec(self.index, ntotal)
+        if spec is None and len(self.tombstones) > self.TOMBSTONE_REBUILD_RATIO * ntotal:
+            spec = index_spec(self.index)
+        saved = sum(1 for s in self.segments if s.file is not None)
+        if spec is None and saved < VECTOR_SEGMENT_MERGE_AT:
+            return
+        self._merging = True
+        threading.Thread(target=self._merge, args=(spec,), daemon=True).start()
+
+    def _merge(self, spec: Optional[IndexSpec]):
+        """Merge the saved segments off-lock and swap the result in when done.
+
+        With a spec, base and segments are rebuilt into a new base index of
+        that spec. Otherwise segments are folded into a copy of the base once
+        they are big enough to be worth it, or merged into one segment before
+        that. Tombstoned vectors are left out either way.
+        """
+        try:
+            with self.lock:
+                base, base_file, tombstones = self.index, self.base_file, self.tombstones
+                merged = [s for s in self.segments if s.file is not None]
+                seg_ids, seg_vectors = self._export(s.index for s in merged)
+                if spec is not None:
+                    base_ids, base_vectors = self._export([base])
+                    snapshot = np.concatenate(
+                        [faiss.vector_to_array(i.id_map) for i in [base] + [s.index for s in merged]]
+                    )
+                else:
+                    snapshot = np.concatenate([faiss.vector_to_array(s.index.id_map) for s in merged])
+
+            fold = spec is not None or len(seg_ids) >= self.SEGMENT_FOLD_RATIO * base.ntotal
+            if spec is not None:
+                logger.info(f"Building {spec} index for {self.store_path} ({len(base_ids) + len(seg_ids)} vectors)")
+                new_index = build_index(
+                    spec, self.dim, np.vstack([base_vectors, seg_vectors]), np.concatenate([base_ids, seg_ids])
+                )
+            elif fold:
+                # Mapped indexes can't grow and clone_index keeps the mapping
+                new_index = read_index(self.store_path / base_file) if self.read_only else faiss.clone_index(base)
+                new_index.add_with_ids(seg_vectors, seg_ids)
+            else:
+                new_index = empty_index(self.dim)
+                new_index.add_with_ids(seg_vectors, seg_ids)
+
+            with self._file_lock():
+                if (
+                    self.read_disk_signature() != self.disk_signature
+                    or self.index is not base
+                    or any(a is not b for a, b in zip(self.segments, merged))
+                ):
+                    logger.info(f"Discarding merge for {self.store_path}: store changed meanwhile")
+                    return
+                rest = self.segments[len(merged):]
+                if fold:
+                    self.index = new_index
+                    self.read_only = False
+                    self._base_dirty = True
+                    self.segments = rest
+                else:
+                    self.segments = [Segment(None, merged[0].first_id, new_index)] + rest
+                dropped = np.intersect1d(tombstones, snapshot)
+                self.tombstones = np.setdiff1d(self.tombstones, dropped)
+                self._tombstones_dirty = True
+                self._unsaved = True
+                self.generation = next(_generations)
+                self.save()
+            logger.info(f"Merged {len(merged)} segments in {self.store_path}"
+                        + (f" into the {index_spec(new_index)} base index" if fold else ""))
+        except Exception as e:
+            logger.error(f"Segment merge failed for {self.store_path}: {e}", exc_info=True)
+        finally:
+            self._merging = False
+
+    def swap_index(self, new_index, tombstones: Optional[np.ndarray] = None):
+        """Replace base and segments with one index holding every live chunk (e.g. re-encoded)."""
+        with self.lock:
+            tombstones = np.empty(0, dtype=np.int64) if tombstones is None else tombstones
+            if new_index.ntotal - len(tombstones) != self.chunks.live_count():
+                raise ValueError("Replacement index must hold exactly the existing chunks")
+            self.index = new_index
+            self.segments = []
+            self.tombstones = tombstones
+            self._tombstones_dirty = True
+            self.read_only = False
+            self._base_dirty = True
+            self._unsaved = True
+            self.generation = next(_generations)
+
+    def nbytes(self) -> int:
+        """Approximate heap size: vector codes and chunk columns not backed by a
+        mapping, plus the id maps, which stay on the heap even for mapped indexes."""
+        index_bytes = id_map_bytes(self.index) if self.read_only else vector_bytes(self.index)
+        index_bytes += sum(
+            vector_bytes(s.index) if s.file is None or not self.mmap else id_map_bytes(s.index)
+            for s in self.segments
+        )
+        return index_bytes + self.tombstones.nbytes + self.chunks.nbytes()
+
+    def _sync(self):
+        """Pick up writes from other processes before mutating, unless ours are unsaved."""
+        if not self._unsaved and self.read_disk_signature() != self.disk_signature:
+            self._load(mmap=self.mmap)
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive per-store lock shared by every worker process; reentrant per instance."""
+        with self.lock:
+            if self._lock_depth == 0:
+                self.store_path.mkdir(parents=True, exist_ok=True)
+                self._lock_fd = os.open(self.store_path / self.LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+                    os.close(self._lock_fd)
+
+    @contextmanager
+    def transaction(self):
+        """Serialize a read-modify-write of this store across threads and processes.
+
+        Picks up whatever other writers committed, runs the body, and commits
+        with save(). If the body raises, in-memory changes are thrown away by
+        reloading the last committed state.
+        """
+        with self._file_lock():
+            self._sync()
+            try:
+                yield self
+            except BaseException:
+                self._load(mmap=self.mmap)
+                raise
+            if self._unsaved:
+                self.save()
+
+    def read_disk_signature(self) -> Tuple:
+        signature = []
+        # Stores written before manifests existed have no manifest.json
+        for path in (
+            self.store_path / self.MANIFEST_FILE,
+            self.store_path / self.INDEX_FILE,
+        ):
+            try:
+                st = path.stat()
+                signature.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def refresh(self):
+        """Reload from disk if the files changed since this instance last synced."""
+        with self.lock:
+            if self.read_disk_signature() != self.disk_signature:
+                self.load()
+
+    def pop_changed_documents(self) -> Set[str]:
+        """Ids of documents whose chunks reloads from disk added or removed since the
+        last call, so per-process caches of another process's writes can be dropped."""
+        with self.lock:
+            changed, self._changed_documents = self._changed_documents, set()
+        return changed
+
+    def index_files(self) -> List[str]:
+        return ([self.base_file] if self.base_file else []) + [s.file for s in self.segments if s.file]
+
+    def _files(self) -> set:
+        files = set(self.index_files()) | set(self.chunks.files())
+        if self._tombstone_file:
+            files.add(self._tombstone_file)
+        return files
 
     def save(self):
-        self.store_path.mkdir(parents=True, exist_ok=True)
-        faiss.write_index(self.index, str(self.store_path / "index.faiss"))
-        with open(self.store_path / "metadata.pkl", "wb") as f:
-            pickle.dump(self.metadata, f)
+        """Commit the in-memory state by atomically replacing manifest.json.
+
+        Call inside transaction() (or with the file lock held) when other
+        writers may be active.
+        """
+        with self._file_lock():
+            (self.store_path / self.SEGMENT_DIR).mkdir(parents=True, exist_ok=True)
+            version = self.manifest_version + 1
+
+            # New files get new names and are never rewritten: readers of the
+            # previous manifest may still have the old ones mapped
+            written = []
+            if self._base_dirty or self.base_file is None:
+                self.base_file = f"index-{version}.faiss"
+                self._write_index(self.index, self.base_file)
+                self._base_dirty = False
+            for i, seg in enumerate(self.segments):
+                if seg.file is None:
+                    name = f"{self.SEGMENT_DIR}/seg-{version}-{i}.faiss"
+                    self._write_index(seg.index, name)
+                    self.segments[i] = seg._replace(file=name)
+                    written.append(i)
+            if self._tombstones_dirty:
+                self._tombstone_file = None
+                if len(self.tombstones):
+                    self._tombstone_file = f"tombstones-{version}.npy"
+                    with open(self.store_path / self._tombstone_file, "wb") as f:
+                        np.save(f, self.tombstones)
+                self._tombstones_dirty = False
+            chunks_meta = self.chunks.save()
+
+            self._write_json(self.MANIFEST_FILE, {
+                "version": version,
+                "base": self.base_file,
+                "segments": [{"file": s.file, "first_id": s.first_id} for s in self.segments],
+                "tombstones": self._tombstone_file,
+                "chunks": chunks_meta,
+            })
+            self.manifest_version = version
+            self.disk_signature = self.read_disk_signature()
+            self._unsaved = False
+
+            current = self._files()
+            for name in self._committed_files - current:
+                (self.store_path / name).unlink(missing_ok=True)
+            self._committed_files = current
+
+            if self.mmap:
+                # Drop the private copies and go back to sharing the page cache
+                if not self.read_only and self.index.ntotal > 0:
+                    self.index = read_index(self.store_path / self.base_file, mmap=True)
+                    self.read_only = True
+                for i in written:
+                    seg = self.segments[i]
+                    if seg.index.ntotal > 0:
+                        self.segments[i] = seg._replace(index=read_index(self.store_path / seg.file, mmap=True))
+
+            self._maybe_merge()
+
+    def _write_index(self, index, name: str):
+        path = self.store_path / name
+        tmp_file = path.with_suffix(".faiss.tmp")
+        faiss.write_index(index, str(tmp_file))
+        os.replace(tmp_file, path)
+
+    def _write_json(self, name: str, data: Dict):
+        path = self.store_path / name
+        tmp_file = path.with_suffix(".json.tmp")
+        tmp_file.write_text(json.dumps(data))
+        os.replace(tmp_file, path)
 
     def load(self):
-        index_file = self.store_path / "index.faiss"
-        meta_file = self.store_path / "metadata.pkl"
+        self._load(mmap=self.mmap)
+
+    def _load(self, mmap: bool):
+        with self.lock:
+            # A first load has nothing cached on top of it yet
+            before = self.chunks.live_documents() if self.disk_signature is not None else None
+            for attempt in range(3):
+                try:
+                    self._read_committed(mmap)
+                    break
+                except FileNotFoundError:
+                    # A writer committed and removed the files of the manifest
+                    # we read; the new manifest is complete, so read that one
+                    if attempt == 2:
+                        raise
+            self._base_dirty = False
+            self._tombstones_dirty = False
+            self._unsaved = False
+            self.generation = next(_generations)
+            if before is not None:
+                self._changed_documents.update(d for d, _ in before ^ self.chunks.live_documents())
+
+            if self._needs_migration():
+                with self._file_lock():
+                    # Another worker may have migrated it while we waited
+                    if self.read_disk_signature() != self.disk_signature:
+                        self._read_committed(mmap)
+                    if self._needs_migration():
+                        self._migrate_legacy_store()
+
+    def _needs_migration(self) -> bool:
+        return (self.store_path / self.LEGACY_META_FILE).exists() or not isinstance(self.index, faiss.IndexIDMap)
+
+    def _read_committed(self, mmap: bool):
+        # Take the signature first so a write racing with this load is
+        # picked up by the next refresh() rather than silently missed.
+        signature = self.read_disk_signature()
+
+        manifest_file = self.store_path / self.MANIFEST_FILE
+        if manifest_file.exists():
+            manifest = json.loads(manifest_file.read_text())
+        else:
+            # New, or a legacy index.faiss + metadata.pkl store awaiting migration
+            base = self.INDEX_FILE if (self.store_path / self.INDEX_FILE).exists() else None
+            manifest = {"version": 0, "base": base, "segments": [], "tombstones": None, "chunks": None}
+
+        self.base_file = manifest["base"]
+        if self.base_file:
+            self.index = self._read_index(self.base_file, mmap)
+            self.read_only = mmap
+        else:
+            self.index = empty_index(self.dim)
+            self.read_only = False
+        self.segments = [
+            Segment(e["file"], e["first_id"], self._read_index(e["file"], mmap))
+            for e in manifest["segments"]
+        ]
+        self._tombstone_file = manifest["tombstones"]
+        self.tombstones = (
+            np.load(self.store_path / self._tombstone_file)
+            if self._tombstone_file else np.empty(0, dtype=np.int64)
+        )
+        self.chunks.load(manifest["chunks"])
+
+        self.manifest_version = manifest["version"]
+        self._committed_files = self._files()
+        self.disk_signature = signature
+
+    def _read_index(self, name: str, mmap: bool):
+        path = self.store_path / name
+        if not path.exists():
+            # faiss reports this as a generic RuntimeError
+            raise FileNotFoundError(path)
+        return read_index(path, mmap=mmap)
+
+    def _migrate_legacy_store(self):
+        """Bring a store written by an older version up to date and commit it, once."""
+        legacy_file = self.store_path / self.LEGACY_META_FILE
+        if legacy_file.exists():
+            # Pre-chunk-store metadata: a pickled list of chunk dicts
+            with open(legacy_file, "rb") as f:
+                metadata = pickle.load(f)
+            self.chunks.clear()
+            self.chunks.append(metadata)
+            logger.info(f"Migrated {len(metadata)} chunks in {self.store_path} to the columnar chunk store")
 
-        if index_file.exists():
-            self.index = faiss.read_index(str(index_file))
+        if not isinstance(self.index, faiss.IndexIDMap):
+            # Pre-id-map index: its rows were the chunk rows
+            if self.read_only:
+                self.index = read_index(self.store_path / self.base_file)
+                self.read_only = False
+            spec = index_spec(self.index)
+            vectors = self.index.reconstruct_n(0, self.index.ntotal)
+            self.index = build_index(spec, self.dim, vectors, np.asarray(self.chunks.columns["id"]))
+            self._base_dirty = True
+            logger.info(f"Migrated {self.index.ntotal} vectors in {self.store_path} to an id-mapped index")
 
-        if meta_file.exists():
-            with open(meta_file, "rb") as f:
-                self.metadata = pickle.load(f)
\ No newline at end of file
+        self.save()
+        legacy_file.unlink(missing_ok=True)
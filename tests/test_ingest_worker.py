@@ -0,0 +1,56 @@
+"""
+The ingestion pool replaces a worker that dies, so queued jobs still run.
+
+Workers are spawned, so the settings below reach them through the
+environment; the stub worker stands in for worker_main, which would need
+the embedding model.
+"""
+import os
+import signal
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("INGEST_QUEUE_PATH", str(Path(tempfile.mkdtemp()) / "ingest_queue.sqlite3"))
+os.environ.setdefault("INGEST_SUPERVISE_S", "0.2")
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test")
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+from app.services import ingest_worker  # noqa: E402
+from app.services.ingest_queue import ingest_queue  # noqa: E402
+from app.services.ingest_worker import IngestWorkerPool  # noqa: E402
+
+
+def _stub_worker(stop_event, parent_pid):
+    while not stop_event.is_set():
+        job = ingest_queue.claim()
+        if job is None:
+            time.sleep(0.05)
+            continue
+        ingest_queue.finish(job["document_id"], "done")
+
+
+def _wait_for(condition, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.1)
+
+
+def test_killed_worker_is_replaced_and_queued_job_completes(monkeypatch):
+    monkeypatch.setattr(ingest_worker, "get_documents_by_status", lambda status: [])
+    pool = IngestWorkerPool(1, target=_stub_worker)
+    assert pool.start()
+    try:
+        victim = pool._processes[0]
+        os.kill(victim.pid, signal.SIGKILL)
+        victim.join()
+        assert pool.stats()["alive"] == 0
+
+        ingest_queue.enqueue("doc-1", "user-1", Path("unused.pdf"))
+        _wait_for(lambda: ingest_queue.stats()["done"] == 1)
+        assert pool.stats()["restarts"] == 1
+        assert pool.stats()["alive"] == 1
+    finally:
+        pool.stop()